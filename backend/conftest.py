@@ -0,0 +1 @@
+# Lets tests import the backend packages (services, models, utils) like main.py does
@@ -1,10 +1,14 @@
+import asyncio
+import functools
 import os
-import shutil
 import tempfile
 import sys
+from contextlib import asynccontextmanager
 from pathlib import Path
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
@@ -15,14 +19,120 @@ load_dotenv()
 sys.path.insert(0, str(Path(__file__).parent))
 
 from models.schemas import AnalyzeRequest, AnalyzeResponse, DiagramSet
-from services.repo_analyzer import analyze_repository
+from services.repo_analyzer import RepoNotFound, analyze_repository
+from services.git_history import HistoryWindow
+from services.import_graph import ParserPool
+from services.retrieval import EmbeddingStore, HashingEmbedder, OllamaEmbedder, retrieve_snippets
 from services.llm_service import analyze_with_llm
+from services.workspace import Workspace, WorkspaceBusy
+from services.cancellation import AnalysisCancelled, CancelToken
+from services.result_cache import ResultCache
+from services.cache_warmer import CacheWarmer
+from services.scheduler import FAST_LANE, HEAVY_LANE, JobEstimate, Scheduler, estimate_job
 from utils.file_utils import calculate_complexity_score, calculate_code_quality
+from utils.blob_cache import BlobCache
+
+# Config from environment
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+# Context window for the analysis prompt (README, dependencies, tree and snippets)
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+TEMP_CLONE_DIR = os.getenv("TEMP_CLONE_DIR", "./temp_repos")
+MAX_REPO_SIZE_MB = int(os.getenv("MAX_REPO_SIZE_MB", "200"))
+BLOB_CACHE_PATH = os.getenv("BLOB_CACHE_PATH", "./cache/blob_cache.sqlite3")
+BLOB_CACHE_MAX_ENTRIES = int(os.getenv("BLOB_CACHE_MAX_ENTRIES", "1000000"))
+# Point WORKSPACE_DIR at a dedicated tmpfs/RAM-disk path (e.g. /dev/shm/repovision) for fast clones
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", TEMP_CLONE_DIR)
+WORKSPACE_BUDGET_MB = int(os.getenv("WORKSPACE_BUDGET_MB", "2048"))
+WORKSPACE_REAP_INTERVAL_S = float(os.getenv("WORKSPACE_REAP_INTERVAL_S", "300"))
+WORKSPACE_ADMISSION_TIMEOUT_S = float(os.getenv("WORKSPACE_ADMISSION_TIMEOUT_S", "120"))
+# Per-request deadlines; abandoned work is killed rather than left holding a clone or LLM slot
+ANALYZE_DEADLINE_S = float(os.getenv("ANALYZE_DEADLINE_S", "600"))
+CLONE_TIMEOUT_S = float(os.getenv("CLONE_TIMEOUT_S", "180"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "300"))
+DISCONNECT_POLL_S = 0.5
+# Admission lanes: cached/small repos get their own slots so they never queue behind giants
+FAST_LANE_SLOTS = int(os.getenv("FAST_LANE_SLOTS", "4"))
+HEAVY_LANE_SLOTS = int(os.getenv("HEAVY_LANE_SLOTS", "1"))
+FAST_LANE_MAX_KB = int(os.getenv("FAST_LANE_MAX_KB", "20000"))
+SCHEDULER_AGING_KB_PER_S = float(os.getenv("SCHEDULER_AGING_KB_PER_S", "1000"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN") or None
+# History mode: bounded window of commits fetched for activity metrics
+HISTORY_DEFAULT_DAYS = int(os.getenv("HISTORY_DEFAULT_DAYS", "90"))
+HISTORY_MAX_COMMITS = int(os.getenv("HISTORY_MAX_COMMITS", "1000"))
+HISTORY_BLOBLESS = os.getenv("HISTORY_BLOBLESS", "true").lower() == "true"
+# Retrieval: embed source chunks and put the most relevant snippets into the prompt
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "true").lower() == "true"
+RETRIEVAL_EMBEDDER = os.getenv("RETRIEVAL_EMBEDDER", "ollama")
+OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBED_INDEX_DIR = os.getenv("EMBED_INDEX_DIR", "./cache/embeddings")
+EMBED_INDEX_MAX_MB = int(os.getenv("EMBED_INDEX_MAX_MB", "2048"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_MAX_CHUNKS = int(os.getenv("RETRIEVAL_MAX_CHUNKS", "2000"))
+RETRIEVAL_BUDGET_S = float(os.getenv("RETRIEVAL_BUDGET_S", "30"))
+# Component diagram from the static import graph instead of the LLM
+IMPORT_GRAPH_ENABLED = os.getenv("IMPORT_GRAPH_ENABLED", "true").lower() == "true"
+IMPORT_GRAPH_MAX_FILES = int(os.getenv("IMPORT_GRAPH_MAX_FILES", "5000"))
+IMPORT_GRAPH_WORKERS = int(os.getenv("IMPORT_GRAPH_WORKERS", "4"))
+# Background re-analysis of popular repos after they are pushed to
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "true").lower() == "true"
+WARMER_TOP_N = int(os.getenv("WARMER_TOP_N", "50"))
+WARMER_INTERVAL_S = float(os.getenv("WARMER_INTERVAL_S", "600"))
+WARMER_MAX_CONCURRENT = int(os.getenv("WARMER_MAX_CONCURRENT", "1"))
+
+# Per-file results shared across repos and forks, keyed by git blob ID
+blob_cache = BlobCache(BLOB_CACHE_PATH, max_entries=BLOB_CACHE_MAX_ENTRIES)
+
+# Per-job clone directories; each job reserves MAX_REPO_SIZE_MB of the budget
+workspace = Workspace(
+    WORKSPACE_DIR,
+    budget_bytes=WORKSPACE_BUDGET_MB * 1024 * 1024,
+    default_reserve_bytes=MAX_REPO_SIZE_MB * 1024 * 1024,
+    reap_interval_s=WORKSPACE_REAP_INTERVAL_S,
+)
+
+# Embedder is swappable: "hashing" is a model-free stand-in for offline use
+if RETRIEVAL_EMBEDDER == "hashing":
+    embedder = HashingEmbedder()
+else:
+    embedder = OllamaEmbedder(OLLAMA_EMBED_MODEL, OLLAMA_BASE_URL, timeout=RETRIEVAL_BUDGET_S)
+embedding_store = EmbeddingStore(EMBED_INDEX_DIR, embedder.name, max_bytes=EMBED_INDEX_MAX_MB * 1024 * 1024)
+
+# Finished analyses keyed by (repo URL, HEAD commit) plus per-repo file counts for cost estimates
+result_cache = ResultCache(max_entries=RESULT_CACHE_MAX_ENTRIES)
+
+scheduler = Scheduler(
+    {FAST_LANE: FAST_LANE_SLOTS, HEAVY_LANE: HEAVY_LANE_SLOTS},
+    aging_kb_per_s=SCHEDULER_AGING_KB_PER_S,
+)
+
+# Import-graph parsing for large repos; one pool of worker processes shared by all requests
+parser_pool = ParserPool(IMPORT_GRAPH_WORKERS) if IMPORT_GRAPH_ENABLED and IMPORT_GRAPH_WORKERS > 1 else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workspace.start()
+    if parser_pool is not None:
+        parser_pool.start()
+    if WARMER_ENABLED:
+        cache_warmer.start()
+    yield
+    if WARMER_ENABLED:
+        await cache_warmer.stop()
+    if parser_pool is not None:
+        parser_pool.stop()
+    workspace.stop()
+
 
 app = FastAPI(
     title="RepoVision API",
     description="GitHub Repository Explainer AI powered by Ollama",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # CORS configuration
@@ -34,71 +144,130 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Config from environment
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
-TEMP_CLONE_DIR = os.getenv("TEMP_CLONE_DIR", "./temp_repos")
-MAX_REPO_SIZE_MB = int(os.getenv("MAX_REPO_SIZE_MB", "200"))
-
-# Ensure temp directory exists
-os.makedirs(TEMP_CLONE_DIR, exist_ok=True)
-
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "ok", "model": OLLAMA_MODEL, "ollama_url": OLLAMA_BASE_URL}
+    return {
+        "status": "ok",
+        "model": OLLAMA_MODEL,
+        "ollama_url": OLLAMA_BASE_URL,
+        "workspace": workspace.stats(),
+        "queues": scheduler.stats(),
+        "cache_warmer": cache_warmer.stats() if WARMER_ENABLED else None,
+    }
 
 
-@app.post("/analyze", response_model=AnalyzeResponse)
-async def analyze_repo(request: AnalyzeRequest):
+@app.get("/queue")
+async def queue_status():
+    """Queue depth, running jobs and wait times per admission lane."""
+    return scheduler.stats()
+
+
+async def watch_request(http_request: Request, cancel: CancelToken):
+    """Cancel the analysis when the client disconnects or the overall deadline passes."""
+    while not cancel.cancelled:
+        if await http_request.is_disconnected():
+            cancel.cancel("client disconnected")
+        elif cancel.expired():
+            cancel.cancel("deadline exceeded", timed_out=True)
+        else:
+            await asyncio.sleep(DISCONNECT_POLL_S)
+
+
+async def run_analysis(
+    repo_url: str,
+    estimate: JobEstimate,
+    cancel: CancelToken,
+    history: Optional[HistoryWindow] = None,
+) -> AnalyzeResponse:
     """
-    Analyze a GitHub repository and return structured AI-generated insights.
+    Run the clone + analyze + LLM pipeline for an admitted job and cache the result.
+    Shared by live requests and the cache warmer.
     """
-    repo_url = request.repo_url.strip()
-
-    # Basic URL validation
-    if not repo_url.startswith("https://github.com/") and not repo_url.startswith("http://github.com/"):
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid GitHub URL. Must start with https://github.com/",
+    job = None
+    try:
+        # Reserve workspace disk from the GitHub pack size (checkout + pack is roughly twice
+        # that). File-count estimates say nothing about assets, so they get the full default.
+        reserve_bytes = None
+        if estimate.source == "github":
+            reserve_bytes = min(
+                max(estimate.cost_kb * 1024 * 2, 16 * 1024 * 1024),
+                MAX_REPO_SIZE_MB * 1024 * 1024,
+            )
+        job = await run_in_threadpool(
+            workspace.acquire, reserve_bytes, timeout=WORKSPACE_ADMISSION_TIMEOUT_S, cancel=cancel
         )
 
-    clone_path = None
-    try:
         # Step 1: Clone and analyze repository
         print(f"[INFO] Cloning repository: {repo_url}")
-        repo_context = analyze_repository(repo_url, TEMP_CLONE_DIR)
-        clone_path = os.path.join(TEMP_CLONE_DIR, repo_context.repo_name)
+        repo_context = await run_in_threadpool(
+            analyze_repository,
+            repo_url,
+            job.path,
+            blob_cache=blob_cache,
+            cancel=cancel,
+            history=history,
+            import_graph_max_files=IMPORT_GRAPH_MAX_FILES if IMPORT_GRAPH_ENABLED else 0,
+            import_graph_pool=parser_pool,
+        )
+        clone_path = os.path.join(job.path, repo_context.repo_name)
 
         print(f"[INFO] Repository cloned. Files: {repo_context.file_count}, Lines: {repo_context.total_lines}")
 
-        # Step 2: Analyze with LLM
+        # Step 2: Retrieve the source snippets most relevant to each prompt section
+        if RETRIEVAL_ENABLED:
+            time_left = cancel.time_left()
+            repo_context.code_snippets = await run_in_threadpool(
+                retrieve_snippets,
+                clone_path,
+                embedder,
+                embedding_store,
+                top_k=RETRIEVAL_TOP_K,
+                max_chunks=RETRIEVAL_MAX_CHUNKS,
+                blobs=repo_context.tree_blobs,
+                batch_size=EMBED_BATCH_SIZE,
+                workers=EMBED_WORKERS,
+                budget_s=RETRIEVAL_BUDGET_S if time_left is None else min(RETRIEVAL_BUDGET_S, time_left),
+                cancel=cancel,
+            )
+
+        # Step 3: Analyze with LLM
         print(f"[INFO] Sending to Ollama ({OLLAMA_MODEL})...")
-        llm_result = analyze_with_llm(repo_context, model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL)
+        llm_result = await run_in_threadpool(
+            analyze_with_llm,
+            repo_context,
+            model=OLLAMA_MODEL,
+            base_url=OLLAMA_BASE_URL,
+            num_ctx=OLLAMA_NUM_CTX,
+            cancel=cancel,
+        )
+        cancel.check()
 
-        # Step 3: Calculate scores
+        # Step 4: Calculate scores
         complexity_score, complexity_label = calculate_complexity_score(
             repo_context.file_count,
             repo_context.total_lines,
             repo_context.languages,
         )
-        code_quality_score = calculate_code_quality(clone_path, repo_context.languages)
+        code_quality_score = await run_in_threadpool(calculate_code_quality, clone_path, repo_context.languages)
 
-        # Step 4: Build response
+        # Step 5: Build response
         response = AnalyzeResponse(
             repo_name=repo_context.repo_name,
             repo_url=repo_url,
             summary=llm_result.get("summary", "No summary available."),
             features=llm_result.get("features", []),
             languages=repo_context.languages,
+            language_stats=repo_context.language_stats,
             frameworks=repo_context.frameworks,
             databases=repo_context.databases,
             architecture_type=llm_result.get("architecture_type", "Unknown"),
             architecture_explanation=llm_result.get("architecture_explanation", ""),
             mermaid_diagrams=DiagramSet(
                 architecture=llm_result.get("mermaid_architecture", "graph TD\n    A[App] --> B[Core]"),
-                component=llm_result.get("mermaid_component", "graph LR\n    A[Module] --> B[Service]"),
+                component=repo_context.component_diagram
+                or llm_result.get("mermaid_component", "graph LR\n    A[Module] --> B[Service]"),
                 flow=llm_result.get("mermaid_flow", "sequenceDiagram\n    User->>App: Request\n    App-->>User: Response"),
             ),
             folder_tree=repo_context.folder_tree,
@@ -111,11 +280,118 @@ async def analyze_repo(request: AnalyzeRequest):
             file_count=repo_context.file_count,
             total_lines=repo_context.total_lines,
             primary_language=repo_context.primary_language,
+            activity=repo_context.activity,
         )
 
+        # A rule-based fallback would otherwise be served until the next push
+        if llm_result.get("fallback"):
+            print(f"[INFO] Not caching fallback analysis for {repo_context.repo_name}")
+        else:
+            result_cache.put(repo_url, estimate.head_sha, response, variant=history_variant(history))
+        result_cache.record_file_count(repo_url, repo_context.file_count)
+
         print(f"[INFO] Analysis complete for {repo_context.repo_name}")
         return response
 
+    finally:
+        # Cleanup happens on the workspace's background remover, off the response path
+        if job is not None:
+            workspace.release(job)
+
+
+def history_window(request: AnalyzeRequest) -> Optional[HistoryWindow]:
+    """Resolve the requested history window, clamped to the configured limits."""
+    if not request.history:
+        return None
+    days = request.history_days or HISTORY_DEFAULT_DAYS
+    commits = min(request.history_commits or HISTORY_MAX_COMMITS, HISTORY_MAX_COMMITS)
+    return HistoryWindow(since_days=max(days, 1), max_commits=max(commits, 1), blobless=HISTORY_BLOBLESS)
+
+
+def history_variant(history: Optional[HistoryWindow]) -> str:
+    """Result-cache variant so history and snapshot analyses are cached separately."""
+    return "" if history is None else f"history:{history.since_days}:{history.max_commits}"
+
+
+def new_cancel_token() -> CancelToken:
+    return CancelToken(
+        deadline_s=ANALYZE_DEADLINE_S,
+        stage_timeouts={"clone": CLONE_TIMEOUT_S, "llm": LLM_TIMEOUT_S},
+    )
+
+
+cache_warmer = CacheWarmer(
+    scheduler,
+    estimate=functools.partial(
+        estimate_job, result_cache=result_cache, fast_lane_max_kb=FAST_LANE_MAX_KB, github_token=GITHUB_TOKEN
+    ),
+    run_job=run_analysis,
+    new_token=new_cancel_token,
+    top_n=WARMER_TOP_N,
+    interval_s=WARMER_INTERVAL_S,
+    max_concurrent=WARMER_MAX_CONCURRENT,
+)
+
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_repo(request: AnalyzeRequest, http_request: Request):
+    """
+    Analyze a GitHub repository and return structured AI-generated insights.
+    The work is cancelled if the client disconnects or a deadline expires.
+    """
+    repo_url = request.repo_url.strip()
+
+    # Basic URL validation
+    if not repo_url.startswith("https://github.com/") and not repo_url.startswith("http://github.com/"):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid GitHub URL. Must start with https://github.com/",
+        )
+
+    history = history_window(request)
+    if history is None:
+        cache_warmer.record_request(repo_url)
+    cancel = new_cancel_token()
+    watcher = asyncio.create_task(watch_request(http_request, cancel))
+
+    ticket = None
+    try:
+        # Step 0: Estimate cost, serve cache hits and wait for a slot in the right lane
+        estimate = await run_in_threadpool(
+            estimate_job,
+            repo_url,
+            result_cache,
+            FAST_LANE_MAX_KB,
+            github_token=GITHUB_TOKEN,
+            variant=history_variant(history),
+        )
+        if estimate.cached_result is not None:
+            print(f"[INFO] Serving cached analysis for {repo_url} @ {estimate.head_sha[:12]}")
+            return estimate.cached_result
+
+        ticket = await scheduler.admit(estimate.lane, estimate.cost_kb, cancel=cancel)
+        print(
+            f"[INFO] Admitted {repo_url} to {estimate.lane} lane "
+            f"(~{estimate.cost_kb} KB via {estimate.source}, waited {ticket.wait_s:.1f}s)"
+        )
+
+        return await run_analysis(repo_url, estimate, cancel, history=history)
+
+    except AnalysisCancelled as e:
+        print(f"[WARN] Analysis of {repo_url} cancelled: {e.reason}")
+        if e.timed_out:
+            raise HTTPException(status_code=504, detail=f"Analysis timed out ({e.reason}).")
+        # Client is gone; the status code is only for logs
+        raise HTTPException(status_code=499, detail="Client closed request.")
+
+    except RepoNotFound as e:
+        print(f"[WARN] {e}")
+        raise HTTPException(status_code=404, detail="Repository not found or is private.")
+
+    except WorkspaceBusy as e:
+        print(f"[WARN] {e}")
+        raise HTTPException(status_code=503, detail="Server is busy. Please try again shortly.")
+
     except Exception as e:
         error_msg = str(e)
         print(f"[ERROR] {error_msg}")
@@ -128,13 +404,9 @@ async def analyze_repo(request: AnalyzeRequest):
             raise HTTPException(status_code=500, detail=f"Analysis failed: {error_msg}")
 
     finally:
-        # Cleanup cloned repo
-        if clone_path and os.path.exists(clone_path):
-            try:
-                shutil.rmtree(clone_path, ignore_errors=True)
-                print(f"[INFO] Cleaned up: {clone_path}")
-            except Exception:
-                pass
+        watcher.cancel()
+        if ticket is not None:
+            scheduler.release(ticket)
 
 
 if __name__ == "__main__":
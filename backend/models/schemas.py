@@ -1,9 +1,43 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
 
 class AnalyzeRequest(BaseModel):
     repo_url: str
+    # Optional history mode: fetch a bounded window of commits for activity metrics
+    history: bool = False
+    history_days: Optional[int] = None
+    history_commits: Optional[int] = None
+
+
+class LanguageStat(BaseModel):
+    language: str
+    files: int
+    lines: int
+    bytes: int
+    percentage: float
+
+
+class ChurnEntry(BaseModel):
+    path: str
+    changes: int
+    commits: int
+    last_active: str
+
+
+class ActivityMetrics(BaseModel):
+    window_days: int
+    max_commits: int
+    commits: int
+    contributors: int
+    contributors_capped: bool = False
+    first_commit: str
+    last_commit: str
+    commits_per_week: float
+    weekly_commits: List[int]
+    churn_unit: str
+    churn_hotspots: List[ChurnEntry]
+    active_directories: List[ChurnEntry]
 
 
 class DiagramSet(BaseModel):
@@ -18,6 +52,7 @@ class AnalyzeResponse(BaseModel):
     summary: str
     features: List[str]
     languages: List[str]
+    language_stats: List[LanguageStat] = []
     frameworks: List[str]
     databases: List[str]
     architecture_type: str
@@ -33,6 +68,7 @@ class AnalyzeResponse(BaseModel):
     file_count: int
     total_lines: int
     primary_language: str
+    activity: Optional[ActivityMetrics] = None
 
 
 class RepoContext(BaseModel):
@@ -47,9 +83,17 @@ class RepoContext(BaseModel):
     go_mod: str
     folder_tree: str
     languages: List[str]
+    language_stats: List[LanguageStat] = []
     frameworks: List[str]
     databases: List[str]
     file_count: int
     total_lines: int
     dependencies: Dict[str, List[str]]
     primary_language: str
+    activity: Optional[ActivityMetrics] = None
+    # Top source snippets per prompt section, from the retrieval stage
+    code_snippets: Dict[str, List[str]] = {}
+    # Mermaid diagram from the static import graph; empty if none was found
+    component_diagram: str = ""
+    # (path, blob_id, size) listing of HEAD from the scan, reused by later stages
+    tree_blobs: List[Tuple[str, str, int]] = []
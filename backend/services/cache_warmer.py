@@ -0,0 +1,157 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List
+
+from fastapi.concurrency import run_in_threadpool
+
+from services.cancellation import AnalysisCancelled, CancelToken
+from services.repo_analyzer import RepoNotFound
+from services.result_cache import normalize_repo_url
+from services.scheduler import JobEstimate, Scheduler
+
+# Request counts are multiplied by this every cycle so popularity tracks recent traffic
+_DECAY = 0.9
+_MIN_SCORE = 0.05
+_PREEMPT_POLL_S = 1.0
+
+
+class CacheWarmer:
+    """
+    Re-analyzes the most requested repositories in the background after they change.
+
+    Every interval_s it takes the top_n repos by (decayed) request count,
+    checks their remote HEAD and re-runs the pipeline for any whose cached
+    result is stale. Warm jobs only start when no live request is queued,
+    and are cancelled as soon as one is, so they only use idle capacity.
+    """
+
+    def __init__(
+        self,
+        scheduler: Scheduler,
+        estimate: Callable[[str], JobEstimate],
+        run_job: Callable[[str, JobEstimate, CancelToken], Awaitable[object]],
+        new_token: Callable[[], CancelToken],
+        top_n: int = 50,
+        interval_s: float = 600.0,
+        max_concurrent: int = 1,
+        max_tracked: int = 5000,
+    ):
+        self.scheduler = scheduler
+        self.estimate = estimate
+        self.run_job = run_job
+        self.new_token = new_token
+        self.top_n = top_n
+        self.interval_s = interval_s
+        self.max_concurrent = max_concurrent
+        self.max_tracked = max_tracked
+
+        # Keyed by normalized URL; _urls keeps the spelling users actually sent,
+        # since warm results are served back to them as-is
+        self._scores: Dict[str, float] = {}
+        self._urls: Dict[str, str] = {}
+        self._running: Dict[str, CancelToken] = {}
+        self._tasks: List[asyncio.Task] = []
+        self.warmed = 0
+        self.preempted = 0
+
+    def record_request(self, repo_url: str) -> None:
+        key = normalize_repo_url(repo_url)
+        self._scores[key] = self._scores.get(key, 0.0) + 1.0
+        self._urls[key] = repo_url.strip()
+        if len(self._scores) > self.max_tracked:
+            # Forget the least popular tenth in one go rather than on every insert
+            keep = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)
+            self._scores = dict(keep[: int(self.max_tracked * 0.9)])
+            self._urls = {key: self._urls[key] for key in self._scores}
+
+    def top_repos(self) -> List[str]:
+        ranked = sorted(self._scores.items(), key=lambda item: item[1], reverse=True)
+        return [self._urls[key] for key, _ in ranked[: self.top_n]]
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._warm_loop()),
+            asyncio.create_task(self._preempt_loop()),
+        ]
+
+    async def stop(self) -> None:
+        for cancel in list(self._running.values()):
+            cancel.cancel("server shutting down")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "tracked_repos": len(self._scores),
+            "running": sorted(self._running),
+            "warmed": self.warmed,
+            "preempted": self.preempted,
+        }
+
+    async def _warm_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            try:
+                await self._warm_cycle()
+            except Exception as e:
+                print(f"[WARN] Cache warmer cycle failed: {e}")
+
+            for key in list(self._scores):
+                self._scores[key] *= _DECAY
+                if self._scores[key] < _MIN_SCORE:
+                    del self._scores[key]
+                    del self._urls[key]
+
+    async def _warm_cycle(self) -> None:
+        for url in self.top_repos():
+            if len(self._running) >= self.max_concurrent:
+                return
+            if url in self._running or self.scheduler.queue_depth() > 0:
+                continue
+
+            # ls-remote tells us whether HEAD moved since the cached analysis
+            try:
+                estimate = await run_in_threadpool(self.estimate, url)
+            except RepoNotFound:
+                # Deleted or made private: stop tracking it
+                key = normalize_repo_url(url)
+                self._scores.pop(key, None)
+                self._urls.pop(key, None)
+                continue
+            if estimate.cached_result is not None:
+                continue
+            # Without a HEAD the result can't be cached, so warming would only
+            # re-clone the repo every cycle (ls-remote failed, private or deleted)
+            if estimate.head_sha is None:
+                continue
+
+            ticket = self.scheduler.try_admit(estimate.lane)
+            if ticket is None:
+                continue
+            cancel = self.new_token()
+            self._running[url] = cancel
+            self._tasks.append(asyncio.create_task(self._warm_one(url, estimate, cancel, ticket)))
+
+    async def _warm_one(self, url: str, estimate: JobEstimate, cancel: CancelToken, ticket) -> None:
+        print(f"[INFO] Warming cache for {url} @ {(estimate.head_sha or '?')[:12]}")
+        try:
+            await self.run_job(url, estimate, cancel)
+            self.warmed += 1
+        except AnalysisCancelled as e:
+            print(f"[INFO] Warm job for {url} stopped: {e.reason}")
+        except Exception as e:
+            print(f"[WARN] Warm job for {url} failed: {e}")
+        finally:
+            self.scheduler.release(ticket)
+            self._running.pop(url, None)
+            self._tasks = [task for task in self._tasks if not task.done()]
+
+    async def _preempt_loop(self) -> None:
+        # Live traffic always wins: any queued request cancels all warm jobs
+        while True:
+            await asyncio.sleep(_PREEMPT_POLL_S)
+            if self._running and self.scheduler.queue_depth() > 0:
+                for cancel in list(self._running.values()):
+                    if not cancel.cancelled:
+                        cancel.cancel("preempted by live traffic")
+                        self.preempted += 1
@@ -0,0 +1,86 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside the pipeline once its request has been cancelled or timed out."""
+
+    def __init__(self, reason: str, timed_out: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.timed_out = timed_out
+
+
+class CancelToken:
+    """
+    Cancellation state shared by every stage of one analysis.
+
+    Holds an overall deadline plus per-stage time limits. cancel() can be
+    called from any thread (e.g. the event loop when the client goes away)
+    and runs registered callbacks so blocking work - a git subprocess, an
+    open Ollama connection - is torn down immediately instead of at the
+    next check().
+    """
+
+    def __init__(self, deadline_s: Optional[float] = None, stage_timeouts: Optional[Dict[str, float]] = None):
+        self._deadline = None if deadline_s is None else time.monotonic() + deadline_s
+        self._stage_timeouts = stage_timeouts or {}
+        self._lock = threading.Lock()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+        self.reason: Optional[str] = None
+        self.timed_out = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def expired(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    def cancel(self, reason: str, timed_out: bool = False) -> None:
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            self.timed_out = timed_out
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[WARN] Cancel callback failed: {e}")
+
+    def check(self) -> None:
+        """Raise AnalysisCancelled if the request was cancelled or its deadline passed."""
+        if self.reason is None and self.expired():
+            self.cancel("deadline exceeded", timed_out=True)
+        if self.reason is not None:
+            raise AnalysisCancelled(self.reason, timed_out=self.timed_out)
+
+    def time_left(self, stage: Optional[str] = None) -> Optional[float]:
+        """Seconds left for a stage: its own limit capped by the overall deadline."""
+        limits = []
+        if stage is not None and stage in self._stage_timeouts:
+            limits.append(self._stage_timeouts[stage])
+        if self._deadline is not None:
+            limits.append(self._deadline - time.monotonic())
+        if not limits:
+            return None
+        return max(min(limits), 0.0)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Register a callback to run on cancel. Returns a function that unregisters it."""
+        with self._lock:
+            if self.reason is None:
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+
+        # Already cancelled: run it right away
+        callback()
+        return lambda: None
@@ -0,0 +1,220 @@
+import os
+import subprocess
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set
+
+from models.schemas import ActivityMetrics, ChurnEntry
+from services.cancellation import CancelToken
+
+# Separators in the `git log --format` header line; neither can appear in paths or emails
+_RECORD = "\x1e"
+_FIELD = "\x1f"
+_LOG_FORMAT = f"--format={_RECORD}%H{_FIELD}%at{_FIELD}%aE"
+
+# Directories are aggregated at most this deep ("src/api/handlers/x.py" -> "src/api")
+_DIR_DEPTH = 2
+_MAX_AUTHORS = 10000
+_WEEK_S = 7 * 24 * 3600
+
+
+@dataclass
+class HistoryWindow:
+    since_days: int
+    max_commits: int
+    blobless: bool = True
+
+
+class TopCounter:
+    """
+    Heavy-hitter counter in bounded memory (Space-Saving style).
+
+    Keeps at most 2 * capacity keys; when that fills up it keeps the
+    `capacity` keys with the highest possible count. A key evicted earlier
+    may have had up to the largest evicted count before it came back, so
+    each entry records that bound as its error. Eviction ranks by
+    count + error, while reported counts are only what was actually seen.
+    """
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        self._floor = 0
+        # key -> [changes, commits, last_ts, error]
+        self._entries: Dict[str, List[int]] = {}
+
+    def add(self, key: str, changes: int, commits: int, ts: int) -> None:
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= 2 * self.capacity:
+                self._prune()
+            entry = self._entries[key] = [0, 0, 0, self._floor]
+        entry[0] += changes
+        entry[1] += commits
+        if ts > entry[2]:
+            entry[2] = ts
+
+    def top(self, n: int, by_recency: bool = False) -> List[ChurnEntry]:
+        index = 2 if by_recency else 0
+        ranked = sorted(self._entries.items(), key=lambda item: item[1][index], reverse=True)[:n]
+        return [
+            ChurnEntry(path=key, changes=changes, commits=commits, last_active=_iso_date(ts))
+            for key, (changes, commits, ts, _) in ranked
+        ]
+
+    def _prune(self) -> None:
+        ranked = sorted(self._entries.items(), key=lambda item: item[1][0] + item[1][3], reverse=True)
+        evicted = ranked[self.capacity][1]
+        self._floor = max(self._floor, evicted[0] + evicted[3])
+        self._entries = dict(ranked[: self.capacity])
+
+
+class ActivityAggregator:
+    """Folds a `git log` stream into activity metrics one line at a time."""
+
+    def __init__(self, churn_unit: str, shallow: Optional[Set[str]] = None):
+        self.churn_unit = churn_unit
+        # Boundary commits of a shallow clone: git diffs them against an empty
+        # tree, so their file lists would count the whole repository as changed
+        self.shallow = shallow or set()
+        self.commits = 0
+        self.first_ts = 0
+        self.last_ts = 0
+        self.authors = set()
+        self.authors_capped = False
+        self.weeks: Dict[int, int] = {}
+        self.files = TopCounter()
+        self.dirs = TopCounter()
+        self._ts = 0
+        self._commit_dirs = set()
+        self._skip_files = False
+
+    def feed(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            if line.startswith(_RECORD):
+                self._start_commit(line[1:].rstrip("\n"))
+            elif line.strip():
+                self._add_path(line.rstrip("\n"))
+
+    def _start_commit(self, header: str) -> None:
+        self._commit_dirs = set()
+        parts = header.split(_FIELD)
+        if len(parts) != 3:
+            return
+        sha, ts, email = parts
+        self._skip_files = sha in self.shallow
+        self._ts = int(ts) if ts.isdigit() else 0
+        self.commits += 1
+        # git log is newest first
+        if not self.last_ts:
+            self.last_ts = self._ts
+        self.first_ts = self._ts
+        if len(self.authors) < _MAX_AUTHORS:
+            self.authors.add(email.lower())
+        else:
+            self.authors_capped = True
+        week = self._ts // _WEEK_S
+        self.weeks[week] = self.weeks.get(week, 0) + 1
+
+    def _add_path(self, line: str) -> None:
+        if self._skip_files:
+            return
+        fields = line.split("\t")
+        if len(fields) == 3:
+            # --numstat: "added<TAB>deleted<TAB>path"; binary files show "-"
+            added, deleted, path = fields
+            changes = (int(added) if added.isdigit() else 0) + (int(deleted) if deleted.isdigit() else 0)
+        else:
+            # --name-only: one touch per file
+            path, changes = line, 1
+
+        self.files.add(path, changes, 1, self._ts)
+
+        parts = path.split("/")[:-1]
+        directory = "/".join(parts[:_DIR_DEPTH]) or "."
+        new_in_commit = directory not in self._commit_dirs
+        self._commit_dirs.add(directory)
+        self.dirs.add(directory, changes, 1 if new_in_commit else 0, self._ts)
+
+    def result(self, window: HistoryWindow, top_n: int = 10) -> ActivityMetrics:
+        span_weeks = max((self.last_ts - self.first_ts) / _WEEK_S, 1.0) if self.commits else 1.0
+        weekly: List[int] = []
+        if self.weeks:
+            last_week = max(self.weeks)
+            weekly = [self.weeks.get(week, 0) for week in range(last_week - 11, last_week + 1)]
+        return ActivityMetrics(
+            window_days=window.since_days,
+            max_commits=window.max_commits,
+            commits=self.commits,
+            contributors=len(self.authors),
+            contributors_capped=self.authors_capped,
+            first_commit=_iso_date(self.first_ts),
+            last_commit=_iso_date(self.last_ts),
+            commits_per_week=round(self.commits / span_weeks, 1),
+            weekly_commits=weekly,
+            churn_unit=self.churn_unit,
+            churn_hotspots=self.files.top(top_n),
+            active_directories=self.dirs.top(top_n, by_recency=True),
+        )
+
+
+def _iso_date(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).date().isoformat() if ts else ""
+
+
+def _shallow_commits(repo_path: str) -> Set[str]:
+    """Commits at the edge of a shallow clone (their parents were not fetched)."""
+    try:
+        with open(os.path.join(repo_path, ".git", "shallow"), "r") as f:
+            return {line.strip() for line in f if line.strip()}
+    except OSError:
+        return set()
+
+
+def collect_activity(
+    repo_path: str,
+    window: HistoryWindow,
+    cancel: Optional[CancelToken] = None,
+) -> ActivityMetrics:
+    """
+    Stream `git log` for the fetched window and aggregate it without buffering the log.
+
+    In a blobless clone, --numstat would lazily fetch every historical blob,
+    so blobless windows use --name-only and count file touches instead of lines.
+    """
+    churn_unit = "touches" if window.blobless else "lines"
+    command = [
+        "git", "-C", repo_path, "log",
+        "--no-renames",
+        f"--max-count={window.max_commits}",
+        f"--since={window.since_days} days ago",
+        _LOG_FORMAT,
+        "--name-only" if window.blobless else "--numstat",
+    ]
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    proc = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        errors="replace",
+        env=env,
+    )
+
+    aggregator = ActivityAggregator(churn_unit, shallow=_shallow_commits(repo_path))
+    unregister = cancel.on_cancel(proc.kill) if cancel else None
+    started = time.monotonic()
+    try:
+        aggregator.feed(proc.stdout)
+        proc.wait()
+    finally:
+        if unregister:
+            unregister()
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+
+    if cancel:
+        cancel.check()
+    print(f"[INFO] Parsed {aggregator.commits} commits in {time.monotonic() - started:.2f}s")
+    return aggregator.result(window)
@@ -0,0 +1,421 @@
+import ast
+import multiprocessing
+import os
+import posixpath
+import re
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.cancellation import CancelToken
+from utils.file_utils import SKIP_DIRS, SKIP_FILES, language_for_filename
+
+GRAPH_LANGUAGES = {"Python", "JavaScript", "TypeScript", "Go", "Java"}
+MAX_FILE_BYTES = 500_000
+# Below this many files, shipping work to other processes costs more than parsing inline
+PARALLEL_MIN_FILES = 300
+# Files per unit of work; small enough that cancellation is noticed quickly
+BATCH_FILES = 200
+# Conventional source directories that are import roots even without an entry script
+_SOURCE_ROOTS = ("src", "lib")
+
+# Bounds that keep the diagram readable and fast to render in the browser
+MAX_NODES = 20
+MAX_EDGES = 40
+
+_JS_IMPORT_RE = re.compile(
+    r"""(?:import|export)\s[^'";]*?from\s*['"]([^'"]+)['"]"""
+    r"""|import\s*['"]([^'"]+)['"]"""
+    r"""|(?:require|import)\s*\(\s*['"]([^'"]+)['"]\s*\)"""
+)
+_GO_BLOCK_RE = re.compile(r"^import\s*\(([^)]*)\)", re.MULTILINE)
+_GO_SINGLE_RE = re.compile(r'^import\s+(?:[\w.]+\s+)?"([^"]+)"', re.MULTILINE)
+_GO_PATH_RE = re.compile(r'"([^"]+)"')
+_JAVA_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+_JAVA_IMPORT_RE = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+(?:\.\*)?)\s*;", re.MULTILINE)
+_PY_IMPORT_RE = re.compile(r"^\s*(?:from\s+(\.*[\w.]*)\s+import|import\s+([\w., ]+))", re.MULTILINE)
+_PY_BLOCK_FIELDS = ("body", "orelse", "finalbody", "handlers", "cases")
+_JS_EXTENSIONS = (".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs")
+
+
+def _python_imports(source: str) -> List[str]:
+    """Imported module names; relative imports keep their leading dots."""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        # Python 2 or otherwise unparsable: fall back to a line regex
+        names = []
+        for from_name, plain in _PY_IMPORT_RE.findall(source):
+            if from_name:
+                names.append(from_name)
+            else:
+                names.extend(n.strip().split(" ")[0] for n in plain.split(","))
+        return names
+
+    # Walk statements only (imports never live inside expressions), which is
+    # several times faster than ast.walk over every node
+    names = []
+    stack = list(tree.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = "." * node.level + (node.module or "")
+            names.append(base)
+            # `from pkg import module` imports submodules too
+            names.extend(f"{base}.{alias.name}" if node.module else base + alias.name for alias in node.names)
+        else:
+            for field in _PY_BLOCK_FIELDS:
+                block = getattr(node, field, None)
+                if block:
+                    stack.extend(block)
+    return names
+
+
+def _parse_file(item: Tuple[str, str, str]) -> Tuple[str, str, List[str], str]:
+    """Returns (rel_path, language, imports, java_package)."""
+    rel_path, abs_path, language = item
+    try:
+        with open(abs_path, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+    except OSError:
+        return rel_path, language, [], ""
+
+    package = ""
+    if language == "Python":
+        imports = _python_imports(source)
+    elif language in ("JavaScript", "TypeScript"):
+        imports = [next(g for g in groups if g) for groups in _JS_IMPORT_RE.findall(source)]
+    elif language == "Go":
+        imports = _GO_SINGLE_RE.findall(source)
+        for block in _GO_BLOCK_RE.findall(source):
+            imports.extend(_GO_PATH_RE.findall(block))
+    else:
+        match = _JAVA_PACKAGE_RE.search(source)
+        package = match.group(1) if match else ""
+        imports = _JAVA_IMPORT_RE.findall(source)
+    return rel_path, language, imports, package
+
+
+def _parse_batch(items: List[Tuple[str, str, str]]) -> List[Tuple[str, str, List[str], str]]:
+    return [_parse_file(item) for item in items]
+
+
+def collect_source_files(repo_path: str, max_files: int) -> List[Tuple[str, str, str]]:
+    """(rel_path, abs_path, language) for every file the graph understands."""
+    files = []
+    for root, dirs, filenames in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        for filename in filenames:
+            if filename in SKIP_FILES:
+                continue
+            language = language_for_filename(filename)
+            if language not in GRAPH_LANGUAGES:
+                continue
+            abs_path = os.path.join(root, filename)
+            try:
+                if os.path.getsize(abs_path) > MAX_FILE_BYTES:
+                    continue
+            except OSError:
+                continue
+            rel_path = os.path.relpath(abs_path, repo_path).replace(os.sep, "/")
+            files.append((rel_path, abs_path, language))
+            if len(files) >= max_files:
+                return files
+    return files
+
+
+class ParserPool:
+    """
+    Worker processes for parsing large repos, shared by all requests and
+    started once with the app. Workers come from a forkserver (or spawn)
+    context, so they are never forked from the multi-threaded server.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def parse(self, batches: List[list], cancel: Optional[CancelToken] = None) -> Optional[list]:
+        """Parse batches in the workers; None if the pool isn't usable."""
+        if self._executor is None:
+            return None
+        try:
+            futures = [self._executor.submit(_parse_batch, batch) for batch in batches]
+        except (BrokenProcessPool, RuntimeError):
+            return None
+
+        try:
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if cancel:
+                    cancel.check()
+            return [parsed for future in futures for parsed in future.result()]
+        except BrokenProcessPool:
+            return None
+        finally:
+            # Free the workers for other requests if we stopped early
+            for future in futures:
+                future.cancel()
+
+
+def parse_files(
+    files: List[Tuple[str, str, str]],
+    pool: Optional[ParserPool] = None,
+    cancel: Optional[CancelToken] = None,
+) -> List[Tuple[str, str, List[str], str]]:
+    """Extract imports from every file, in the worker pool for large repos."""
+    batches = [files[i:i + BATCH_FILES] for i in range(0, len(files), BATCH_FILES)]
+    if pool is not None and len(files) >= PARALLEL_MIN_FILES:
+        parsed = pool.parse(batches, cancel=cancel)
+        if parsed is not None:
+            return parsed
+        print("[WARN] Import graph worker pool unavailable, parsing inline")
+
+    parsed = []
+    for batch in batches:
+        parsed.extend(_parse_batch(batch))
+        if cancel:
+            cancel.check()
+    return parsed
+
+
+class _Resolver:
+    """Maps import strings to files inside the repository."""
+
+    def __init__(self, parsed: List[Tuple[str, str, List[str], str]], go_modules: Dict[str, str]):
+        self.paths: Set[str] = {rel_path for rel_path, _, _, _ in parsed}
+        self.go_modules = go_modules
+        self._py_roots_cache: Dict[str, List[str]] = {}
+
+        # Java: package name -> files declaring it
+        self.java_packages: Dict[str, List[str]] = defaultdict(list)
+        for rel_path, language, _, package in parsed:
+            if language == "Java" and package:
+                self.java_packages[package].append(rel_path)
+
+    def resolve(self, rel_path: str, language: str, name: str) -> Optional[str]:
+        if language == "Python":
+            return self._python(rel_path, name)
+        if language in ("JavaScript", "TypeScript"):
+            return self._js(rel_path, name)
+        if language == "Go":
+            return self._go(name)
+        return self._java(name)
+
+    def _python(self, rel_path: str, name: str) -> Optional[str]:
+        if name.startswith("."):
+            level = len(name) - len(name.lstrip("."))
+            package = rel_path.split("/")[:-1]
+            if level > 1:
+                package = package[: len(package) - (level - 1)]
+            return self._python_module("/".join(package), [p for p in name[level:].split(".") if p])
+
+        # Absolute imports only resolve under an import root, so `import logging`
+        # doesn't match some unrelated `app/logging.py`
+        parts = name.split(".")
+        for root in self._python_roots(posixpath.dirname(rel_path)):
+            target = self._python_module(root, parts)
+            if target:
+                return target
+        return None
+
+    def _python_module(self, root: str, parts: List[str]) -> Optional[str]:
+        """Longest prefix of parts that is a module or package file under root."""
+        for end in range(len(parts), 0, -1):
+            base = posixpath.join(root, *parts[:end])
+            if base + ".py" in self.paths:
+                return base + ".py"
+            if base + "/__init__.py" in self.paths:
+                return base + "/__init__.py"
+        return None
+
+    def _python_roots(self, directory: str) -> List[str]:
+        """
+        Directories an absolute import from `directory` can resolve against,
+        nearest first: every enclosing directory that is not itself a package
+        (where a script run from there puts itself on sys.path), then src/ and lib/.
+        """
+        roots = self._py_roots_cache.get(directory)
+        if roots is None:
+            roots = []
+            current = directory
+            while True:
+                if f"{current}/__init__.py" not in self.paths:
+                    roots.append(current)
+                if not current:
+                    break
+                current = posixpath.dirname(current)
+            roots.extend(r for r in _SOURCE_ROOTS if r not in roots)
+            self._py_roots_cache[directory] = roots
+        return roots
+
+    def _js(self, rel_path: str, spec: str) -> Optional[str]:
+        if not spec.startswith("."):
+            return None
+        base = posixpath.normpath(posixpath.join(posixpath.dirname(rel_path), spec))
+        if base in self.paths:
+            return base
+        for ext in _JS_EXTENSIONS:
+            if base + ext in self.paths:
+                return base + ext
+            if f"{base}/index{ext}" in self.paths:
+                return f"{base}/index{ext}"
+        return None
+
+    def _go(self, import_path: str) -> Optional[str]:
+        for module, module_dir in self.go_modules.items():
+            if import_path == module or import_path.startswith(module + "/"):
+                sub = import_path[len(module):].lstrip("/")
+                # Point at the package directory itself; any file name works for grouping
+                return posixpath.join(module_dir, sub, "_") if sub or module_dir else "_"
+        return None
+
+    def _java(self, name: str) -> Optional[str]:
+        package = name[:-2] if name.endswith(".*") else name.rsplit(".", 1)[0]
+        candidates = self.java_packages.get(package)
+        return candidates[0] if candidates else None
+
+
+def _go_modules(repo_path: str, parsed) -> Dict[str, str]:
+    modules = {}
+    dirs = {posixpath.dirname(p) for p, language, _, _ in parsed if language == "Go"}
+    for directory in {""} | dirs:
+        go_mod = os.path.join(repo_path, directory, "go.mod")
+        if not os.path.isfile(go_mod):
+            continue
+        with open(go_mod, "r", encoding="utf-8", errors="replace") as f:
+            match = re.search(r"^module\s+(\S+)", f.read(), re.MULTILINE)
+        if match:
+            modules[match.group(1)] = directory
+    return modules
+
+
+def _group_of(path: str, depth: int) -> str:
+    parts = path.split("/")[:-1]
+    return "/".join(parts[:depth]) or "(root)"
+
+
+def _label_propagation(nodes: List[str], edges: Dict[Tuple[str, str], int]) -> Dict[str, str]:
+    """Weighted label propagation on the undirected graph; returns node -> community label."""
+    neighbours: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for (a, b), weight in edges.items():
+        neighbours[a][b] += weight
+        neighbours[b][a] += weight
+
+    labels = {node: node for node in nodes}
+    # Visit high-degree nodes first so big hubs seed communities; fully deterministic
+    order = sorted(nodes, key=lambda n: (-sum(neighbours[n].values()), n))
+    for _ in range(20):
+        changed = False
+        for node in order:
+            if not neighbours[node]:
+                continue
+            scores: Dict[str, int] = defaultdict(int)
+            for other, weight in neighbours[node].items():
+                scores[labels[other]] += weight
+            best = max(scores.items(), key=lambda item: (item[1], item[0] == labels[node], item[0]))[0]
+            if best != labels[node]:
+                labels[node] = best
+                changed = True
+        if not changed:
+            break
+    return labels
+
+
+def _community_name(members: List[str]) -> str:
+    prefix = posixpath.commonpath(members) if len(members) > 1 and "(root)" not in members else ""
+    if prefix:
+        return f"{prefix}/*"
+    return f"{members[0]} +{len(members) - 1}" if len(members) > 1 else members[0]
+
+
+def _collapse(edges: Dict[Tuple[str, str], int], mapping: Dict[str, str]) -> Dict[Tuple[str, str], int]:
+    collapsed: Dict[Tuple[str, str], int] = defaultdict(int)
+    for (a, b), weight in edges.items():
+        a, b = mapping.get(a, a), mapping.get(b, b)
+        if a != b:
+            collapsed[(a, b)] += weight
+    return collapsed
+
+
+def _to_mermaid(edges: Dict[Tuple[str, str], int]) -> str:
+    ids: Dict[str, str] = {}
+    lines = ["graph LR"]
+    for a, b in edges:
+        for name in (a, b):
+            if name not in ids:
+                ids[name] = f"n{len(ids)}"
+                label = name.replace('"', "'")
+                lines.append(f'    {ids[name]}["{label}"]')
+    for (a, b), weight in edges.items():
+        lines.append(f"    {ids[a]} -->|{weight}| {ids[b]}")
+    return "\n".join(lines)
+
+
+def build_component_diagram(
+    repo_path: str,
+    max_files: int = 5000,
+    pool: Optional[ParserPool] = None,
+    cancel: Optional[CancelToken] = None,
+) -> str:
+    """
+    Mermaid component diagram from static imports, grouped by directory.
+    Returns "" when no internal dependencies were found.
+    """
+    files = collect_source_files(repo_path, max_files)
+    if not files:
+        return ""
+    parsed = parse_files(files, pool=pool, cancel=cancel)
+    resolver = _Resolver(parsed, _go_modules(repo_path, parsed))
+
+    file_edges: Dict[Tuple[str, str], int] = defaultdict(int)
+    for rel_path, language, imports, _ in parsed:
+        for name in set(imports):
+            target = resolver.resolve(rel_path, language, name)
+            if target and target != rel_path:
+                file_edges[(rel_path, target)] += 1
+
+    # Directory level first: two levels deep, one level if that is already too many groups
+    for depth in (2, 1):
+        edges = _collapse(file_edges, {p: _group_of(p, depth) for pair in file_edges for p in pair})
+        nodes = sorted({n for pair in edges for n in pair})
+        if len(nodes) <= MAX_NODES:
+            break
+
+    if len(nodes) > MAX_NODES:
+        labels = _label_propagation(nodes, edges)
+        communities: Dict[str, List[str]] = defaultdict(list)
+        for node, label in labels.items():
+            communities[label].append(node)
+        names = {node: _community_name(sorted(members)) for members in communities.values() for node in members}
+        grouped = _collapse(edges, names)
+        # One giant community would swallow every edge; fall back to the directories
+        if grouped:
+            edges = grouped
+
+        # Still too big: keep the best-connected groups
+        degree: Dict[str, int] = defaultdict(int)
+        for (a, b), weight in edges.items():
+            degree[a] += weight
+            degree[b] += weight
+        keep = set(sorted(degree, key=lambda n: (-degree[n], n))[:MAX_NODES])
+        edges = {pair: w for pair, w in edges.items() if pair[0] in keep and pair[1] in keep}
+
+    if not edges:
+        return ""
+    strongest = sorted(edges.items(), key=lambda item: (-item[1], item[0]))[:MAX_EDGES]
+    return _to_mermaid(dict(strongest))
@@ -1,10 +1,12 @@
 import json
 import re
+import time
 from typing import Optional
 
 import ollama
 
 from models.schemas import RepoContext
+from services.cancellation import AnalysisCancelled, CancelToken
 
 
 SYSTEM_PROMPT = """You are an expert software architect and code analyst. 
@@ -12,14 +14,53 @@ Analyze the provided GitHub repository information and return a structured JSON
 Be concise, accurate, and insightful. Always return valid JSON."""
 
 
+def format_activity(ctx: RepoContext) -> str:
+    """Compact summary of recent git activity for the prompt, if history was collected."""
+    activity = ctx.activity
+    if activity is None or not activity.commits:
+        return ""
+    hotspots = ", ".join(f"{c.path} ({c.changes})" for c in activity.churn_hotspots[:5])
+    active_dirs = ", ".join(f"{d.path} ({d.last_active})" for d in activity.active_directories[:5])
+    return f"""
+Recent Activity (last {activity.window_days} days, up to {activity.max_commits} commits):
+Commits: {activity.commits}, Contributors: {activity.contributors}, Commits/week: {activity.commits_per_week}
+Churn hotspots ({activity.churn_unit}): {hotspots}
+Recently active directories: {active_dirs}
+"""
+
+
+def format_snippets(ctx: RepoContext, max_chars_per_section: int = 2500) -> str:
+    """Retrieved source snippets grouped by the prompt section they inform."""
+    if not ctx.code_snippets:
+        return ""
+    parts = ["\nRelevant Source Snippets:"]
+    for section, snippets in ctx.code_snippets.items():
+        if not snippets:
+            continue
+        budget = max_chars_per_section
+        parts.append(f"[{section}]")
+        for snippet in snippets:
+            if budget <= 0:
+                break
+            parts.append(snippet[:budget])
+            budget -= len(snippet)
+    return "\n".join(parts) + "\n"
+
+
 def build_analysis_prompt(ctx: RepoContext) -> str:
     """Build a structured prompt from the repo context."""
+    # The component diagram is already known from the import graph; don't ask for it
+    component_field = (
+        "" if ctx.component_diagram
+        else '  "mermaid_component": "graph LR\\n    A[Component1] --> B[Component2]",\n'
+    )
     prompt = f"""Analyze this GitHub repository and return a JSON object with the exact structure shown below.
 
 Repository: {ctx.repo_name}
 URL: {ctx.repo_url}
 Primary Language: {ctx.primary_language}
 Languages Detected: {', '.join(ctx.languages[:8])}
+Language Breakdown (by bytes): {', '.join(f"{s.language} {s.percentage}%" for s in ctx.language_stats[:8]) or 'Unknown'}
 Frameworks Detected: {', '.join(ctx.frameworks[:8]) if ctx.frameworks else 'None detected'}
 Databases Detected: {', '.join(ctx.databases[:5]) if ctx.databases else 'None detected'}
 File Count: {ctx.file_count}
@@ -34,7 +75,7 @@ Requirements/Dependencies:
 
 Folder Structure:
 {ctx.folder_tree[:2000]}
-
+{format_activity(ctx)}{format_snippets(ctx)}
 Return ONLY this JSON (no markdown, no explanation):
 {{
   "summary": "2-3 sentence description of what this project does and its main purpose",
@@ -52,8 +93,7 @@ Return ONLY this JSON (no markdown, no explanation):
     "Security concern 2"
   ],
   "mermaid_architecture": "graph TD\\n    A[Client] --> B[Backend]\\n    B --> C[Database]",
-  "mermaid_component": "graph LR\\n    A[Component1] --> B[Component2]",
-  "mermaid_flow": "sequenceDiagram\\n    User->>App: Action\\n    App->>DB: Query\\n    DB-->>App: Result\\n    App-->>User: Response"
+{component_field}  "mermaid_flow": "sequenceDiagram\\n    User->>App: Action\\n    App->>DB: Query\\n    DB-->>App: Result\\n    App-->>User: Response"
 }}"""
     return prompt
 
@@ -121,6 +161,8 @@ def generate_fallback_analysis(ctx: RepoContext) -> dict:
         arch_diagram = f"graph TD\n    A[{ctx.repo_name}] --> B[Core Logic]\n    B --> C[Output]"
 
     return {
+        # Marks a result that didn't come from the LLM, so it isn't cached
+        "fallback": True,
         "summary": summary,
         "features": [
             f"Built with {ctx.primary_language}",
@@ -147,7 +189,7 @@ def generate_fallback_analysis(ctx: RepoContext) -> dict:
             "Ensure sensitive data is not hardcoded in source files",
         ],
         "mermaid_architecture": arch_diagram,
-        "mermaid_component": (
+        "mermaid_component": ctx.component_diagram or (
             f"graph LR\n"
             f"    A[{ctx.repo_name}] --> B[Core Modules]\n"
             f"    B --> C[Utilities]\n"
@@ -167,16 +209,33 @@ def generate_fallback_analysis(ctx: RepoContext) -> dict:
     }
 
 
-def analyze_with_llm(ctx: RepoContext, model: str = "mistral", base_url: str = "http://localhost:11434") -> dict:
+def analyze_with_llm(
+    ctx: RepoContext,
+    model: str = "mistral",
+    base_url: str = "http://localhost:11434",
+    num_ctx: int = 8192,
+    cancel: Optional[CancelToken] = None,
+) -> dict:
     """
     Send repo context to Ollama LLM and get structured analysis.
-    Falls back to rule-based analysis if Ollama is unavailable.
+    Falls back to rule-based analysis (marked with "fallback": True) if Ollama is
+    unavailable, returns malformed JSON or the LLM stage times out.
+    Raises AnalysisCancelled if the request itself is cancelled.
     """
+    unregister = None
     try:
-        client = ollama.Client(host=base_url)
+        timeout = cancel.time_left("llm") if cancel else None
+        client = ollama.Client(host=base_url, timeout=timeout)
         prompt = build_analysis_prompt(ctx)
 
-        response = client.chat(
+        # Closing the HTTP client aborts the in-flight request, which makes Ollama
+        # stop generating and frees its slot for someone else
+        http_client = getattr(client, "_client", None)
+        if cancel and http_client is not None:
+            unregister = cancel.on_cancel(http_client.close)
+
+        # Stream so the deadline and cancellation are checked between chunks
+        stream = client.chat(
             model=model,
             messages=[
                 {"role": "system", "content": SYSTEM_PROMPT},
@@ -185,10 +244,23 @@ def analyze_with_llm(ctx: RepoContext, model: str = "mistral", base_url: str = "
             options={
                 "temperature": 0.3,
                 "num_predict": 2048,
+                # Ollama's default window is smaller than this prompt and would
+                # silently drop its beginning
+                "num_ctx": num_ctx,
             },
+            stream=True,
         )
 
-        raw_content = response["message"]["content"]
+        started = time.monotonic()
+        chunks = []
+        for chunk in stream:
+            if cancel:
+                cancel.check()
+                if timeout is not None and time.monotonic() - started > timeout:
+                    raise TimeoutError(f"LLM stage exceeded {timeout:.0f}s")
+            chunks.append(chunk["message"]["content"])
+
+        raw_content = "".join(chunks)
         parsed = parse_llm_response(raw_content)
 
         if parsed and "summary" in parsed:
@@ -198,5 +270,11 @@ def analyze_with_llm(ctx: RepoContext, model: str = "mistral", base_url: str = "
             return generate_fallback_analysis(ctx)
 
     except Exception as e:
+        if cancel and cancel.cancelled:
+            raise AnalysisCancelled(cancel.reason, timed_out=cancel.timed_out)
         print(f"[LLM] Ollama unavailable ({e}), using rule-based fallback")
         return generate_fallback_analysis(ctx)
+
+    finally:
+        if unregister:
+            unregister()
@@ -1,19 +1,37 @@
 import os
+import re
 import shutil
+import subprocess
 import tempfile
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 import git
 
 from models.schemas import RepoContext
+from services.cancellation import AnalysisCancelled, CancelToken
+from services.git_history import HistoryWindow, collect_activity
+from services.import_graph import ParserPool, build_component_diagram
 from utils.file_utils import (
     detect_languages,
+    detect_languages_from_blobs,
     detect_frameworks,
     build_folder_tree,
     read_file_safe,
 )
 
 
+# `git ls-remote` errors that mean the repo is missing or private, not a network hiccup
+_MISSING_REPO_RE = re.compile(
+    r"repository not found|could not read username|does not appear to be a git repository",
+    re.IGNORECASE,
+)
+
+
+class RepoNotFound(Exception):
+    """Raised when the remote says the repository does not exist or needs credentials."""
+
+
 def extract_repo_name(repo_url: str) -> str:
     """Extract repo name from GitHub URL."""
     url = repo_url.rstrip("/")
@@ -24,8 +42,17 @@ def extract_repo_name(repo_url: str) -> str:
     return name
 
 
-def clone_repository(repo_url: str, clone_dir: str) -> str:
-    """Clone a GitHub repository to a temp directory. Returns the clone path."""
+def clone_repository(
+    repo_url: str,
+    clone_dir: str,
+    cancel: Optional[CancelToken] = None,
+    history: Optional[HistoryWindow] = None,
+) -> str:
+    """
+    Clone a GitHub repository to a temp directory. Returns the clone path.
+    With a history window, fetch up to max_commits of history (blobless if configured).
+    The git process is killed if the cancel token fires or the clone stage times out.
+    """
     repo_name = extract_repo_name(repo_url)
     clone_path = os.path.join(clone_dir, repo_name)
 
@@ -33,17 +60,86 @@ def clone_repository(repo_url: str, clone_dir: str) -> str:
     if os.path.exists(clone_path):
         shutil.rmtree(clone_path, ignore_errors=True)
 
-    # Clone with depth=1 for speed
-    git.Repo.clone_from(
-        repo_url,
-        clone_path,
-        depth=1,
-        no_single_branch=False,
-    )
+    # Clone with depth=1 for speed; never block on a credential prompt
+    command = ["git", "clone", "--depth=1"]
+    if history is not None:
+        # Historic trees without their blobs are enough for `git log --name-only`.
+        # One extra commit so the window's oldest commit still has its parent to diff against
+        command = ["git", "clone", f"--depth={history.max_commits + 1}"]
+        if history.blobless:
+            command.append("--filter=blob:none")
+    command += ["--", repo_url, clone_path]
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+
+    unregister = cancel.on_cancel(proc.kill) if cancel else None
+    try:
+        timeout = cancel.time_left("clone") if cancel else None
+        try:
+            _, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise AnalysisCancelled("clone timed out", timed_out=True)
+    finally:
+        if unregister:
+            unregister()
+
+    if cancel:
+        cancel.check()
+    if proc.returncode != 0:
+        raise git.GitCommandError(command, proc.returncode, stderr.decode("utf-8", "replace"))
 
     return clone_path
 
 
+def get_remote_head(repo_url: str, timeout: float = 15.0) -> Optional[str]:
+    """
+    Return the remote HEAD commit via `git ls-remote` (no clone), or None if unavailable.
+    Raises RepoNotFound if the remote reports the repository missing or private.
+    """
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    try:
+        result = subprocess.run(
+            ["git", "ls-remote", "--", repo_url, "HEAD"],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            env=env,
+        )
+    except (subprocess.TimeoutExpired, OSError):
+        return None
+    if result.returncode != 0 and _MISSING_REPO_RE.search(result.stderr or ""):
+        raise RepoNotFound(f"Repository not found or is private: {repo_url}")
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return result.stdout.split()[0]
+
+
+def list_tree_blobs(repo_path: str) -> Optional[List[Tuple[str, str, int]]]:
+    """
+    List (path, blob_id, size) for every regular file at HEAD using `git ls-tree`,
+    which reads only tree objects. Returns None if the listing is unavailable.
+    """
+    try:
+        output = git.Repo(repo_path).git.ls_tree("-r", "-l", "-z", "HEAD")
+    except Exception as e:
+        print(f"[WARN] git ls-tree failed ({e}), falling back to directory walk")
+        return None
+
+    blobs = []
+    for record in output.split("\0"):
+        if not record:
+            continue
+        meta, path = record.split("\t", 1)
+        mode, obj_type, oid, size = meta.split()
+        # Skip submodules (commit) and symlinks
+        if obj_type != "blob" or mode == "120000":
+            continue
+        blobs.append((path, oid, int(size)))
+    return blobs
+
+
 def read_key_files(repo_path: str) -> dict:
     """Read important configuration/dependency files from the repo."""
     key_files = {
@@ -69,14 +165,33 @@ def read_key_files(repo_path: str) -> dict:
     return result
 
 
-def analyze_repository(repo_url: str, temp_dir: str) -> RepoContext:
+def analyze_repository(
+    repo_url: str,
+    temp_dir: str,
+    blob_cache=None,
+    cancel: Optional[CancelToken] = None,
+    history: Optional[HistoryWindow] = None,
+    import_graph_max_files: int = 0,
+    import_graph_pool: Optional[ParserPool] = None,
+) -> RepoContext:
     """
     Main function: clone repo, analyze it, return RepoContext.
+    When a blob cache is given, per-file results are reused across repos and forks.
+    When a history window is given, activity metrics are collected from `git log`.
+    When import_graph_max_files > 0, the component diagram is built from static imports.
     """
-    clone_path = clone_repository(repo_url, temp_dir)
+    clone_path = clone_repository(repo_url, temp_dir, cancel=cancel, history=history)
 
     # Detect languages
-    languages, primary_language, file_count, total_lines = detect_languages(clone_path)
+    blobs = list_tree_blobs(clone_path) if blob_cache is not None else None
+    if blobs is not None:
+        languages, primary_language, file_count, total_lines, language_stats = detect_languages_from_blobs(
+            clone_path, blobs, blob_cache
+        )
+    else:
+        languages, primary_language, file_count, total_lines, language_stats = detect_languages(clone_path)
+    if cancel:
+        cancel.check()
 
     # Detect frameworks and databases
     frameworks, databases, dependencies = detect_frameworks(clone_path, languages)
@@ -84,10 +199,29 @@ def analyze_repository(repo_url: str, temp_dir: str) -> RepoContext:
     # Build folder tree
     repo_name = extract_repo_name(repo_url)
     folder_tree = f"📁 {repo_name}/\n" + build_folder_tree(clone_path, max_depth=4)
+    if cancel:
+        cancel.check()
 
     # Read key files
     key_files = read_key_files(clone_path)
 
+    # Repository activity from the fetched history window
+    activity = collect_activity(clone_path, history, cancel=cancel) if history is not None else None
+
+    # Component diagram from the static import graph
+    component_diagram = ""
+    if import_graph_max_files > 0:
+        try:
+            component_diagram = build_component_diagram(
+                clone_path, max_files=import_graph_max_files, pool=import_graph_pool, cancel=cancel
+            )
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            print(f"[WARN] Import graph failed: {e}")
+        if cancel:
+            cancel.check()
+
     return RepoContext(
         repo_name=repo_name,
         repo_url=repo_url,
@@ -100,10 +234,14 @@ def analyze_repository(repo_url: str, temp_dir: str) -> RepoContext:
         go_mod=key_files.get("go_mod", ""),
         folder_tree=folder_tree,
         languages=languages,
+        language_stats=language_stats,
         frameworks=frameworks,
         databases=databases,
         file_count=file_count,
         total_lines=total_lines,
         dependencies=dependencies,
         primary_language=primary_language,
+        activity=activity,
+        component_diagram=component_diagram,
+        tree_blobs=blobs or [],
     )
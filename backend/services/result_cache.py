@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def normalize_repo_url(repo_url: str) -> str:
+    """Canonical form of a GitHub URL so trivially different spellings share cache entries."""
+    url = repo_url.strip().rstrip("/").lower()
+    if url.endswith(".git"):
+        url = url[:-4]
+    if url.startswith("http://"):
+        url = "https://" + url[len("http://"):]
+    return url
+
+
+class ResultCache:
+    """
+    In-memory LRU of finished analyses keyed by (repo URL, HEAD commit, variant),
+    plus the last seen file count per repo for cost estimates. The variant
+    separates results of different analysis modes (e.g. history windows).
+
+    A new push changes HEAD, so stale results are never served; they
+    simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 256, max_repos: int = 10000):
+        self.max_entries = max_entries
+        self.max_repos = max_repos
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[tuple, object]" = OrderedDict()
+        self._file_counts: "OrderedDict[str, int]" = OrderedDict()
+
+    def get(self, repo_url: str, head_sha: Optional[str], variant: str = ""):
+        if not head_sha:
+            return None
+        key = (normalize_repo_url(repo_url), head_sha, variant)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def put(self, repo_url: str, head_sha: Optional[str], result, variant: str = "") -> None:
+        if not head_sha:
+            return
+        key = (normalize_repo_url(repo_url), head_sha, variant)
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+
+    def record_file_count(self, repo_url: str, file_count: int) -> None:
+        url = normalize_repo_url(repo_url)
+        with self._lock:
+            self._file_counts[url] = file_count
+            self._file_counts.move_to_end(url)
+            while len(self._file_counts) > self.max_repos:
+                self._file_counts.popitem(last=False)
+
+    def last_file_count(self, repo_url: str) -> Optional[int]:
+        with self._lock:
+            return self._file_counts.get(normalize_repo_url(repo_url))
@@ -0,0 +1,399 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import ollama
+
+from services.cancellation import CancelToken
+from utils.file_utils import SKIP_DIRS, SKIP_FILES, classify_filename
+
+CHUNK_LINES = 60
+MAX_CHUNK_CHARS = 2000
+MAX_FILE_BYTES = 200_000
+# So one huge file can't use up the whole chunk budget
+MAX_CHUNKS_PER_FILE = 20
+# Directories that rarely explain how the project works; indexed last
+_LOW_PRIORITY_DIRS = {
+    "docs", "doc", "examples", "example", "samples", "benchmarks", "bench",
+    "test", "tests", "testing", "spec", "fixtures", "scripts", "third_party", "vendor",
+}
+_STALE_TMP_S = 3600
+
+# What each prompt section wants to see from the code
+SECTION_QUERIES: Dict[str, str] = {
+    "architecture": "application entry point, main modules, routing, request handlers and how components are wired together",
+    "security": "authentication, authorization, secrets, passwords, tokens, input validation, SQL queries, shell commands",
+    "improvements": "error handling, TODO, FIXME, duplicated logic, configuration, tests",
+}
+
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]+")
+
+
+@dataclass
+class Chunk:
+    path: str
+    start_line: int
+    text: str
+
+
+class OllamaEmbedder:
+    """Embeddings from the local Ollama server (`/api/embed`)."""
+
+    def __init__(self, model: str, base_url: str, timeout: Optional[float] = None):
+        self.name = f"ollama-{model}".replace("/", "_").replace(":", "_")
+        self.model = model
+        self._client = ollama.Client(host=base_url, timeout=timeout)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        response = self._client.embed(model=self.model, input=texts)
+        return np.asarray(response["embeddings"], dtype=np.float32)
+
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in that needs no model: hashes identifier tokens
+    into a fixed-size bag-of-words vector. Useful offline and in development.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.name = f"hashing-{dim}"
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dim] += 1.0
+        return vectors
+
+
+class EmbeddingStore:
+    """
+    On-disk chunk vectors keyed by git blob ID, one float32 .npy file per blob,
+    memory-mapped on load. Identical files in any repo or fork are embedded once.
+
+    Loading a file bumps its mtime; once the store grows past max_bytes the
+    least recently used files are deleted.
+    """
+
+    def __init__(self, root: str, embedder_name: str, max_bytes: int = 2 * 1024**3):
+        self.root = os.path.join(root, embedder_name)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = sum(size for _, size, _ in self._files())
+
+    def _path(self, oid: str) -> str:
+        return os.path.join(self.root, oid[:2], f"{oid}.npy")
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every stored file; drops temp files left by crashed writers."""
+        files = []
+        now = time.time()
+        for root, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                    if filename.endswith(".tmp"):
+                        if now - stat.st_mtime > _STALE_TMP_S:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def load(self, oid: str) -> Optional[np.ndarray]:
+        path = self._path(oid)
+        try:
+            vectors = np.load(path, mmap_mode="r")
+            os.utime(path)
+            return vectors
+        except (OSError, ValueError):
+            return None
+
+    def save(self, oid: str, vectors: np.ndarray) -> None:
+        path = self._path(oid)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Unique per writer: concurrent analyses may save the same blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{oid}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, vectors)
+            size = os.path.getsize(tmp_path)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            self._bytes += size - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Down to 90% of the budget so the full scan is amortized over many saves
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self._bytes = total
+        if removed:
+            print(f"[RETRIEVAL] Evicted {removed} embedding files, {total // (1024 * 1024)} MB left")
+
+
+def git_blob_id(data: bytes) -> str:
+    """Same ID `git hash-object` gives, so the store lines up with git's object names."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _walk_source_files(repo_path: str):
+    """(rel_path, None, size) for source files on disk; blob IDs are hashed after reading."""
+    for root, dirs, filenames in os.walk(repo_path):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        for filename in filenames:
+            if filename in SKIP_FILES or classify_filename(filename) < 0:
+                continue
+            filepath = os.path.join(root, filename)
+            try:
+                size = os.path.getsize(filepath)
+            except OSError:
+                continue
+            yield os.path.relpath(filepath, repo_path).replace(os.sep, "/"), None, size
+
+
+def _listed_source_files(blobs: List[Tuple[str, str, int]]):
+    """Same selection as _walk_source_files, from a `git ls-tree` listing."""
+    for rel_path, oid, size in blobs:
+        parts = rel_path.split("/")
+        if parts[-1] in SKIP_FILES or classify_filename(parts[-1]) < 0:
+            continue
+        if any(d in SKIP_DIRS or d.startswith(".") for d in parts[:-1]):
+            continue
+        yield rel_path, oid, size
+
+
+def _prioritize(sources) -> list:
+    """
+    Order files so a truncated index still covers the whole repo: round-robin
+    across top-level directories, shallow files first within each, and
+    docs/tests/examples-like directories only after everything else.
+    """
+    groups: Dict[Tuple[bool, str], list] = {}
+    for source in sources:
+        parts = source[0].split("/")
+        low = any(d.lower() in _LOW_PRIORITY_DIRS for d in parts[:-1])
+        groups.setdefault((low, parts[0] if len(parts) > 1 else ""), []).append(source)
+
+    ordered = []
+    for low in (False, True):
+        queues = [
+            sorted(files, key=lambda s: (s[0].count("/"), s[0]))
+            for (is_low, _), files in sorted(groups.items())
+            if is_low == low
+        ]
+        for i in range(max((len(q) for q in queues), default=0)):
+            ordered.extend(q[i] for q in queues if i < len(q))
+    return ordered
+
+
+def chunk_source_files(
+    repo_path: str,
+    max_chunks: int,
+    blobs: Optional[List[Tuple[str, str, int]]] = None,
+) -> List[Tuple[str, List[Chunk]]]:
+    """
+    Split source files into line-based chunks. Returns [(blob_id, chunks)] per file.
+    With the (path, blob_id, size) listing from the scan, files aren't walked or hashed again.
+    Files are taken in _prioritize order until max_chunks is reached.
+    """
+    files: List[Tuple[str, List[Chunk]]] = []
+    total = 0
+
+    sources = _listed_source_files(blobs) if blobs else _walk_source_files(repo_path)
+    for rel_path, oid, size in _prioritize(s for s in sources if s[2] <= MAX_FILE_BYTES):
+        try:
+            with open(os.path.join(repo_path, rel_path), "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+
+        lines = data.decode("utf-8", "replace").splitlines()
+        chunks = [
+            Chunk(rel_path, start + 1, "\n".join(lines[start:start + CHUNK_LINES])[:MAX_CHUNK_CHARS])
+            for start in range(0, len(lines), CHUNK_LINES)
+        ]
+        chunks = [c for c in chunks if c.text.strip()][:MAX_CHUNKS_PER_FILE]
+        if not chunks:
+            continue
+
+        files.append((oid or git_blob_id(data), chunks))
+        total += len(chunks)
+        if total >= max_chunks:
+            return files
+    return files
+
+
+def _embed_text(chunk: Chunk) -> str:
+    return f"{chunk.path}\n{chunk.text}"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+def build_index(
+    files: List[Tuple[str, List[Chunk]]],
+    embedder,
+    store: EmbeddingStore,
+    batch_size: int = 32,
+    workers: int = 4,
+    budget_s: float = 60.0,
+    cancel: Optional[CancelToken] = None,
+) -> Tuple[np.ndarray, List[Chunk]]:
+    """
+    Vectors for every chunk, reusing stored blobs and embedding the rest in
+    parallel batches. Returns once budget_s runs out even if requests are
+    still in flight; files not fully embedded by then are left out of this
+    index (and picked up by the next analysis).
+    """
+    matrices: List[np.ndarray] = []
+    indexed: List[Chunk] = []
+    missing: List[Tuple[str, List[Chunk]]] = []
+
+    for oid, chunks in files:
+        vectors = store.load(oid)
+        if vectors is not None and len(vectors) == len(chunks):
+            matrices.append(vectors)
+            indexed.extend(chunks)
+        else:
+            missing.append((oid, chunks))
+
+    # Flatten missing chunks into batches; remember which file each row belongs to
+    rows = [(file_no, chunk) for file_no, (_, chunks) in enumerate(missing) for chunk in chunks]
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    results: Dict[int, np.ndarray] = {}
+    deadline = time.monotonic() + budget_s
+
+    if batches:
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = {}
+            next_batch = 0
+            while next_batch < len(batches) or pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Out of budget: abandon whatever is still in flight
+                    break
+                # One batch per worker, so nothing sits queued past the deadline
+                while next_batch < len(batches) and len(pending) < workers:
+                    texts = [_embed_text(chunk) for _, chunk in batches[next_batch]]
+                    pending[pool.submit(embedder.embed, texts)] = next_batch
+                    next_batch += 1
+                done, _ = wait(pending, timeout=min(remaining, 1.0), return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+                if cancel:
+                    cancel.check()
+        finally:
+            # Don't wait for abandoned batches; their results are simply dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # Reassemble per-file matrices from completed batches
+    per_file: Dict[int, List[np.ndarray]] = {}
+    complete = set(range(len(missing)))
+    for batch_no, batch in enumerate(batches):
+        vectors = results.get(batch_no)
+        for row, (file_no, _) in enumerate(batch):
+            if vectors is None:
+                complete.discard(file_no)
+            else:
+                per_file.setdefault(file_no, []).append(vectors[row])
+
+    for file_no in sorted(complete):
+        oid, chunks = missing[file_no]
+        vectors = _normalize(np.vstack(per_file[file_no]))
+        store.save(oid, vectors)
+        matrices.append(vectors)
+        indexed.extend(chunks)
+
+    if not matrices:
+        return np.zeros((0, 0), dtype=np.float32), []
+    return np.vstack(matrices), indexed
+
+
+def retrieve_snippets(
+    repo_path: str,
+    embedder,
+    store: EmbeddingStore,
+    top_k: int = 4,
+    max_chunks: int = 2000,
+    blobs: Optional[List[Tuple[str, str, int]]] = None,
+    batch_size: int = 32,
+    workers: int = 4,
+    budget_s: float = 60.0,
+    cancel: Optional[CancelToken] = None,
+) -> Dict[str, List[str]]:
+    """
+    Top-k source snippets per prompt section (see SECTION_QUERIES).
+    Returns {} if embedding is unavailable, so the prompt just goes without.
+    """
+    started = time.monotonic()
+    try:
+        files = chunk_source_files(repo_path, max_chunks, blobs=blobs)
+        matrix, chunks = build_index(
+            files, embedder, store, batch_size=batch_size, workers=workers, budget_s=budget_s, cancel=cancel
+        )
+        if not chunks:
+            return {}
+        queries = _normalize(embedder.embed(list(SECTION_QUERIES.values())))
+    except Exception as e:
+        if cancel:
+            cancel.check()
+        print(f"[RETRIEVAL] Embedding unavailable ({e}), skipping snippets")
+        return {}
+
+    scores = queries @ matrix.T
+    snippets: Dict[str, List[str]] = {}
+    used = set()
+    for section, row in zip(SECTION_QUERIES, scores):
+        picked = []
+        for i in np.argsort(-row):
+            if i in used:
+                continue
+            used.add(i)
+            chunk = chunks[i]
+            picked.append(f"# {chunk.path}:{chunk.start_line}\n{chunk.text}")
+            if len(picked) == top_k:
+                break
+        snippets[section] = picked
+
+    print(f"[RETRIEVAL] Indexed {len(chunks)} chunks in {time.monotonic() - started:.2f}s")
+    return snippets
@@ -0,0 +1,202 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+from services.cancellation import CancelToken
+from services.repo_analyzer import get_remote_head
+from services.result_cache import ResultCache
+
+FAST_LANE = "fast"
+HEAVY_LANE = "heavy"
+
+# Rough on-disk size of one source file, to turn a known file count into a cost
+KB_PER_FILE = 8
+
+# While the GitHub API rate limit is exhausted, don't ask it again before this time
+_api_blocked_until = 0.0
+
+
+@dataclass
+class JobEstimate:
+    lane: str
+    cost_kb: int
+    source: str
+    head_sha: Optional[str] = None
+    cached_result: object = None
+
+
+def fetch_github_size_kb(repo_url: str, token: Optional[str] = None, timeout: float = 5.0) -> Optional[int]:
+    """Repository pack size in KB from the GitHub API, or None if unavailable or rate limited."""
+    global _api_blocked_until
+    if time.time() < _api_blocked_until:
+        return None
+
+    parts = repo_url.rstrip("/").split("/")
+    if len(parts) < 5:
+        return None
+    owner, name = parts[3], parts[4]
+    if name.endswith(".git"):
+        name = name[:-4]
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        response = httpx.get(f"https://api.github.com/repos/{owner}/{name}", headers=headers, timeout=timeout)
+        if response.status_code in (403, 429) and response.headers.get("x-ratelimit-remaining") == "0":
+            reset = response.headers.get("x-ratelimit-reset", "")
+            _api_blocked_until = float(reset) if reset.isdigit() else time.time() + 60
+            print("[WARN] GitHub API rate limit reached, estimating without repo sizes until it resets")
+            return None
+        if response.status_code != 200:
+            return None
+        return int(response.json().get("size", 0))
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+def estimate_job(
+    repo_url: str,
+    result_cache: ResultCache,
+    fast_lane_max_kb: int,
+    github_token: Optional[str] = None,
+    variant: str = "",
+) -> JobEstimate:
+    """
+    Estimate what an analysis will cost before admitting it.
+    Cheapest signal first: cached result for the current HEAD, then the
+    file count seen last time, then the remote pack size from the GitHub API.
+    Raises RepoNotFound (from ls-remote) so missing repos fail without queueing.
+    """
+    head_sha = get_remote_head(repo_url)
+
+    cached = result_cache.get(repo_url, head_sha, variant)
+    if cached is not None:
+        return JobEstimate(FAST_LANE, 0, "cache", head_sha, cached)
+
+    file_count = result_cache.last_file_count(repo_url)
+    if file_count is not None:
+        cost_kb, source = file_count * KB_PER_FILE, "history"
+    else:
+        size_kb = fetch_github_size_kb(repo_url, token=github_token)
+        if size_kb is None:
+            # Unknown size (API error or rate limit): queue at the back of the fast
+            # lane rather than behind the biggest clones in the single heavy slot.
+            # Disk is still bounded by the full MAX_REPO_SIZE_MB reservation.
+            return JobEstimate(FAST_LANE, fast_lane_max_kb, "unknown", head_sha)
+        cost_kb, source = size_kb, "github"
+
+    lane = FAST_LANE if cost_kb <= fast_lane_max_kb else HEAVY_LANE
+    return JobEstimate(lane, cost_kb, source, head_sha)
+
+
+@dataclass
+class _Waiter:
+    cost: int
+    enqueued: float
+    future: asyncio.Future
+
+
+@dataclass
+class _Lane:
+    capacity: int
+    running: int = 0
+    waiters: List[_Waiter] = field(default_factory=list)
+    admitted: int = 0
+    avg_wait_s: float = 0.0
+
+
+@dataclass
+class Ticket:
+    lane: str
+    wait_s: float
+
+
+class Scheduler:
+    """
+    Admission control with one queue per lane and a fixed number of slots each.
+
+    Within a lane the cheapest job goes first (shortest-job-first), but every
+    second spent waiting subtracts aging_kb_per_s from a job's cost so big
+    jobs cannot starve behind a steady stream of small ones.
+    """
+
+    def __init__(self, capacities: Dict[str, int], aging_kb_per_s: float = 1000.0):
+        self.aging_kb_per_s = aging_kb_per_s
+        self._lanes = {name: _Lane(capacity=capacity) for name, capacity in capacities.items()}
+
+    async def admit(self, lane_name: str, cost: int, cancel: Optional[CancelToken] = None) -> Ticket:
+        """Wait for a slot in the lane. Raises AnalysisCancelled if the token fires first."""
+        lane = self._lanes[lane_name]
+        enqueued = time.monotonic()
+
+        if lane.running < lane.capacity and not lane.waiters:
+            lane.running += 1
+            return self._granted(lane_name, lane, enqueued)
+
+        waiter = _Waiter(cost, enqueued, asyncio.get_running_loop().create_future())
+        lane.waiters.append(waiter)
+        try:
+            while True:
+                done, _ = await asyncio.wait({waiter.future}, timeout=0.5)
+                if done:
+                    return self._granted(lane_name, lane, enqueued)
+                if cancel is not None:
+                    cancel.check()
+        except BaseException:
+            if waiter.future.done():
+                # Slot was handed over just as we gave up: pass it on
+                self.release(Ticket(lane_name, 0.0))
+            else:
+                waiter.future.cancel()
+                lane.waiters.remove(waiter)
+            raise
+
+    def try_admit(self, lane_name: str) -> Optional[Ticket]:
+        """Take a slot only if the whole scheduler is idle enough; used by background work."""
+        lane = self._lanes[lane_name]
+        if lane.running >= lane.capacity or any(l.waiters for l in self._lanes.values()):
+            return None
+        lane.running += 1
+        return Ticket(lane_name, 0.0)
+
+    def queue_depth(self, lane_name: Optional[str] = None) -> int:
+        """Waiting jobs in one lane, or across all lanes."""
+        if lane_name is not None:
+            return len(self._lanes[lane_name].waiters)
+        return sum(len(lane.waiters) for lane in self._lanes.values())
+
+    def release(self, ticket: Ticket) -> None:
+        lane = self._lanes[ticket.lane]
+        if lane.waiters:
+            # Slot passes straight to the next job, so `running` is unchanged
+            now = time.monotonic()
+            nxt = min(lane.waiters, key=lambda w: w.cost - self.aging_kb_per_s * (now - w.enqueued))
+            lane.waiters.remove(nxt)
+            nxt.future.set_result(None)
+        else:
+            lane.running -= 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            name: {
+                "capacity": lane.capacity,
+                "running": lane.running,
+                "queue_depth": len(lane.waiters),
+                "oldest_wait_s": round(max((now - w.enqueued for w in lane.waiters), default=0.0), 2),
+                "avg_wait_s": round(lane.avg_wait_s, 2),
+                "admitted": lane.admitted,
+            }
+            for name, lane in self._lanes.items()
+        }
+
+    def _granted(self, lane_name: str, lane: _Lane, enqueued: float) -> Ticket:
+        wait_s = time.monotonic() - enqueued
+        lane.admitted += 1
+        # Exponential moving average keeps the stat cheap and recent
+        lane.avg_wait_s = wait_s if lane.admitted == 1 else 0.9 * lane.avg_wait_s + 0.1 * wait_s
+        return Ticket(lane_name, wait_s)
@@ -0,0 +1,225 @@
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+# Job directories are named job-<pid>-<id>; trees awaiting removal trash-<pid>-<id>
+_ENTRY_RE = re.compile(r"^(job|trash)-(\d+)-([0-9a-f]+)$")
+
+
+class WorkspaceBusy(Exception):
+    """Raised when no disk budget frees up within the admission timeout."""
+
+
+@dataclass
+class JobDir:
+    job_id: str
+    path: str
+    reserved_bytes: int
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Workspace:
+    """
+    Per-job clone directories under a dedicated root (e.g. a tmpfs mount)
+    with a total byte budget.
+
+    Each job reserves bytes up front; acquire() waits while the budget is
+    exhausted. Released trees are renamed out of the way and deleted by a
+    background thread, and their reservation is only returned once the
+    bytes are really gone. Directories left behind by killed processes are
+    reaped on start() and then periodically.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        budget_bytes: int,
+        default_reserve_bytes: int,
+        reap_interval_s: float = 300.0,
+    ):
+        self.root = os.path.abspath(root)
+        self.budget_bytes = budget_bytes
+        self.default_reserve_bytes = default_reserve_bytes
+        self.reap_interval_s = reap_interval_s
+
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._active: Dict[str, JobDir] = {}
+        self._used_bytes = 0
+        self._pending_removals = 0
+        # Job IDs handed to this process's remover thread and not yet deleted
+        self._queued_ids = set()
+        self._removals: "queue.Queue[Optional[JobDir]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self) -> None:
+        """Create the root, reap orphans from earlier runs and start the background threads."""
+        os.makedirs(self.root, exist_ok=True)
+        self.reap_orphans()
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._remove_loop, name="workspace-remover", daemon=True),
+            threading.Thread(target=self._reap_loop, name="workspace-reaper", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._removals.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+    def acquire(
+        self,
+        reserve_bytes: Optional[int] = None,
+        timeout: Optional[float] = None,
+        cancel=None,
+    ) -> JobDir:
+        """
+        Reserve budget and create a fresh job directory, waiting for space if needed.
+        A cancel token (see services.cancellation) aborts the wait.
+        """
+        reserve = reserve_bytes or self.default_reserve_bytes
+        # A single job larger than the whole budget still gets admitted, alone
+        reserve = min(reserve, self.budget_bytes)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while True:
+                over_budget = self._used_bytes + reserve > self.budget_bytes
+                # The budget is only an estimate; also make sure the disk really has the room
+                disk_full = not over_budget and self._free_bytes() < reserve
+                if not over_budget and not disk_full:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise WorkspaceBusy(
+                        f"Workspace budget exhausted ({self._used_bytes // (1024 * 1024)} MB in use"
+                        f"{', disk full' if disk_full else ''})"
+                    )
+                if cancel is not None:
+                    cancel.check()
+                if cancel is not None or disk_full:
+                    # Wake up periodically to notice cancellation or freed disk space
+                    remaining = 0.5 if remaining is None else min(remaining, 0.5)
+                self._cond.wait(remaining)
+
+            job_id = uuid.uuid4().hex[:12]
+            job = JobDir(
+                job_id=job_id,
+                path=os.path.join(self.root, f"job-{self._pid}-{job_id}"),
+                reserved_bytes=reserve,
+            )
+            self._active[job_id] = job
+            self._used_bytes += reserve
+
+        try:
+            os.makedirs(job.path)
+        except OSError:
+            with self._cond:
+                self._active.pop(job_id, None)
+                self._used_bytes -= reserve
+                self._cond.notify_all()
+            raise
+        return job
+
+    def _free_bytes(self) -> int:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            # Can't tell; rely on the budget alone
+            return self.budget_bytes
+
+    def release(self, job: JobDir) -> None:
+        """Hand a job directory to the background remover; returns immediately."""
+        with self._cond:
+            if self._active.pop(job.job_id, None) is None:
+                return
+            self._pending_removals += 1
+            self._queued_ids.add(job.job_id)
+
+        trash_path = os.path.join(self.root, f"trash-{self._pid}-{job.job_id}")
+        try:
+            os.rename(job.path, trash_path)
+            job.path = trash_path
+        except OSError:
+            pass
+        self._removals.put(job)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "root": self.root,
+                "budget_mb": self.budget_bytes // (1024 * 1024),
+                "reserved_mb": self._used_bytes // (1024 * 1024),
+                "active_jobs": len(self._active),
+                "pending_removals": self._pending_removals,
+            }
+
+    def reap_orphans(self) -> int:
+        """Delete job/trash directories not owned by a live job. Returns the number reaped."""
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+
+        with self._cond:
+            owned_ids = set(self._active) | self._queued_ids
+
+        reaped = 0
+        for entry in entries:
+            match = _ENTRY_RE.match(entry.name)
+            if not match or not entry.is_dir(follow_symlinks=False):
+                continue
+            pid, job_id = int(match.group(2)), match.group(3)
+
+            if pid == self._pid:
+                # Live jobs and queued removals are ours; anything else with our PID
+                # is left over from an earlier run that happened to get the same PID
+                if job_id in owned_ids:
+                    continue
+            elif _pid_alive(pid):
+                continue
+
+            shutil.rmtree(entry.path, ignore_errors=True)
+            reaped += 1
+
+        if reaped:
+            print(f"[INFO] Workspace reaped {reaped} orphaned director{'y' if reaped == 1 else 'ies'}")
+        return reaped
+
+    def _remove_loop(self) -> None:
+        while True:
+            job = self._removals.get()
+            if job is None:
+                return
+            shutil.rmtree(job.path, ignore_errors=True)
+            with self._cond:
+                self._used_bytes -= job.reserved_bytes
+                self._pending_removals -= 1
+                self._queued_ids.discard(job.job_id)
+                self._cond.notify_all()
+
+    def _reap_loop(self) -> None:
+        while not self._stop.wait(self.reap_interval_s):
+            try:
+                self.reap_orphans()
+            except Exception as e:
+                print(f"[WARN] Workspace reaper failed: {e}")
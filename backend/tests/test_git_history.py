@@ -0,0 +1,57 @@
+import os
+import subprocess
+
+from services.git_history import HistoryWindow, TopCounter, collect_activity
+
+
+def _git(cwd, *args):
+    env = dict(
+        os.environ,
+        GIT_AUTHOR_NAME="dev", GIT_AUTHOR_EMAIL="dev@example.com",
+        GIT_COMMITTER_NAME="dev", GIT_COMMITTER_EMAIL="dev@example.com",
+    )
+    subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True)
+
+
+def _make_repo(path, tree_files=50, edits=4):
+    os.makedirs(path)
+    _git(path, "init", "-q")
+    for i in range(tree_files):
+        with open(os.path.join(path, f"file{i}.txt"), "w") as f:
+            f.write("x\n")
+    _git(path, "add", "-A")
+    _git(path, "commit", "-q", "-m", "initial")
+    for i in range(edits):
+        with open(os.path.join(path, "hot.py"), "a") as f:
+            f.write(f"line {i}\n")
+        _git(path, "add", "-A")
+        _git(path, "commit", "-q", "-m", f"edit {i}")
+
+
+def test_shallow_boundary_does_not_count_whole_tree(tmp_path):
+    origin = str(tmp_path / "origin")
+    clone = str(tmp_path / "clone")
+    _make_repo(origin)
+    # Boundary commit lands inside the window, as with --depth=max_commits
+    subprocess.run(
+        ["git", "clone", "-q", "--depth=3", f"file://{origin}", clone], check=True, capture_output=True
+    )
+
+    for blobless in (True, False):
+        activity = collect_activity(clone, HistoryWindow(since_days=90, max_commits=3, blobless=blobless))
+        assert activity.commits == 3
+        assert [entry.path for entry in activity.churn_hotspots] == ["hot.py"]
+
+
+def test_top_counter_reports_only_observed_counts():
+    counter = TopCounter(capacity=2)
+    for i in range(20):
+        counter.add(f"cold{i}", 1, 1, i)
+    counter.add("late", 1, 1, 100)
+    for _ in range(3):
+        counter.add("hot", 5, 1, 50)
+
+    entries = {entry.path: entry for entry in counter.top(10)}
+    assert entries["late"].changes == 1
+    assert entries["hot"].changes == 15
+    assert counter.top(1)[0].path == "hot"
@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+# SQLite caps bound parameters per statement (999 on older builds)
+_BATCH_SIZE = 500
+
+
+class BlobCache:
+    """
+    Per-file analysis results keyed by git blob object ID.
+
+    A blob ID names file *content*, so results computed once are valid for
+    every repo, fork and vendored copy that contains the same file. Entries
+    live in a local SQLite file and the least recently used ones are evicted
+    once the cache grows past max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " oid TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+
+    def get_many(self, oids: Iterable[str]) -> Dict[str, dict]:
+        """Look up cached results for the given blob IDs and mark them as recently used."""
+        oids = list(dict.fromkeys(oids))
+        found: Dict[str, dict] = {}
+        now = time.time()
+
+        with self._lock:
+            for start in range(0, len(oids), _BATCH_SIZE):
+                batch = oids[start:start + _BATCH_SIZE]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT oid, value FROM blobs WHERE oid IN ({placeholders})", batch
+                ).fetchall()
+                if not rows:
+                    continue
+                for oid, value in rows:
+                    found[oid] = json.loads(value)
+                hit_oids = [oid for oid, _ in rows]
+                self._conn.execute(
+                    f"UPDATE blobs SET last_used = ? WHERE oid IN ({','.join('?' * len(hit_oids))})",
+                    [now, *hit_oids],
+                )
+            self._conn.commit()
+
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, dict]]) -> None:
+        """
+        Store results for analyzed blobs, evicting old entries if over budget.
+        Existing entries are overwritten, so callers can refresh outdated values.
+        """
+        now = time.time()
+        rows: List[Tuple[str, str, float]] = [
+            (oid, json.dumps(value, separators=(",", ":")), now) for oid, value in items
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO blobs (oid, value, last_used) VALUES (?, ?, ?)", rows
+            )
+            inserted = self._conn.total_changes - before
+            self._count += inserted
+            if inserted < len(rows):
+                # Some oids were already stored: replace their values
+                self._conn.executemany(
+                    "UPDATE blobs SET value = ?, last_used = ? WHERE oid = ? AND value != ?",
+                    [(value, used, oid, value) for oid, value, used in rows],
+                )
+
+            if self._count > self.max_entries:
+                # Evict down to 90% of the budget so eviction is amortized over many puts
+                excess = self._count - int(self.max_entries * 0.9)
+                self._conn.execute(
+                    "DELETE FROM blobs WHERE oid IN ("
+                    " SELECT oid FROM blobs ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._count = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,6 +1,7 @@
 import os
-from pathlib import Path
-from typing import List, Dict, Tuple
+import re
+from array import array
+from typing import List, Dict, Optional, Tuple
 
 # Language detection by extension
 EXTENSION_MAP: Dict[str, str] = {
@@ -36,8 +37,73 @@ EXTENSION_MAP: Dict[str, str] = {
     ".toml": "TOML",
     ".xml": "XML",
     ".md": "Markdown",
+    ".h": "C",
+    ".hpp": "C++",
+    ".cc": "C++",
+    ".mjs": "JavaScript",
+    ".cjs": "JavaScript",
+    ".zsh": "Shell",
+    ".pl": "Perl",
+    ".mk": "Makefile",
+    ".cmake": "CMake",
+    ".dockerfile": "Dockerfile",
 }
 
+# Extension languages that are data/docs rather than code
+NON_CODE_LANGUAGES = {"JSON", "YAML", "TOML", "XML", "Markdown"}
+
+# Well-known extensionless (or oddly named) files
+FILENAME_MAP: Dict[str, str] = {
+    "Dockerfile": "Dockerfile",
+    "Containerfile": "Dockerfile",
+    "Makefile": "Makefile",
+    "makefile": "Makefile",
+    "GNUmakefile": "Makefile",
+    "CMakeLists.txt": "CMake",
+    "Rakefile": "Ruby",
+    "Gemfile": "Ruby",
+    "Vagrantfile": "Ruby",
+    "Jenkinsfile": "Groovy",
+    "BUILD": "Starlark",
+    "BUILD.bazel": "Starlark",
+    "WORKSPACE": "Starlark",
+}
+
+# Interpreter named in a `#!` line -> language, for extensionless scripts
+SHEBANG_MAP: Dict[str, str] = {
+    "python": "Python",
+    "node": "JavaScript",
+    "deno": "TypeScript",
+    "sh": "Shell",
+    "bash": "Shell",
+    "zsh": "Shell",
+    "dash": "Shell",
+    "ksh": "Shell",
+    "ruby": "Ruby",
+    "perl": "Perl",
+    "php": "PHP",
+    "lua": "Lua",
+    "Rscript": "R",
+}
+
+# Precompiled classification tables: every language gets a dense index so the
+# scan can count into flat arrays and compare ints instead of strings
+_LANGUAGE_NAMES: List[str] = sorted(
+    (set(EXTENSION_MAP.values()) | set(FILENAME_MAP.values()) | set(SHEBANG_MAP.values()))
+    - NON_CODE_LANGUAGES
+)
+_LANGUAGE_INDEX: Dict[str, int] = {name: i for i, name in enumerate(_LANGUAGE_NAMES)}
+_EXT_TABLE: Dict[str, int] = {
+    ext: _LANGUAGE_INDEX[lang] for ext, lang in EXTENSION_MAP.items() if lang in _LANGUAGE_INDEX
+}
+_FILENAME_TABLE: Dict[str, int] = {name: _LANGUAGE_INDEX[lang] for name, lang in FILENAME_MAP.items()}
+_SHEBANG_TABLE: Dict[str, int] = {prog: _LANGUAGE_INDEX[lang] for prog, lang in SHEBANG_MAP.items()}
+_SHEBANG_RE = re.compile(rb"#!\s*(\S+)(?:[ \t]+(\S+))?")
+_SHEBANG_MAX = 128
+_READ_CHUNK = 1 << 16
+# classify_filename result for extensionless files whose language depends on a shebang
+_SNIFF = -2
+
 # Directories to skip
 SKIP_DIRS = {
     ".git", "node_modules", "__pycache__", ".venv", "venv", "env",
@@ -65,14 +131,113 @@ def read_file_safe(path: str, max_chars: int = 8000) -> str:
     return ""
 
 
-def detect_languages(repo_path: str) -> Tuple[List[str], str, int, int]:
+def classify_filename(filename: str) -> int:
     """
-    Detect programming languages used in the repo.
-    Returns: (languages_list, primary_language, file_count, total_lines)
+    Language index for a filename, from the precompiled tables.
+    Returns _SNIFF for extensionless files (decided by shebang) and -1 if unknown.
     """
-    lang_counts: Dict[str, int] = {}
-    file_count = 0
-    total_lines = 0
+    idx = _FILENAME_TABLE.get(filename)
+    if idx is not None:
+        return idx
+    dot = filename.rfind(".")
+    if dot > 0:
+        idx = _EXT_TABLE.get(filename[dot:].lower(), -1)
+        if idx < 0 and filename.startswith("Dockerfile."):
+            return _LANGUAGE_INDEX["Dockerfile"]
+        return idx
+    # Dotfiles (".bashrc") are config, not source
+    return _SNIFF if dot < 0 else -1
+
+
+def language_for_filename(filename: str) -> Optional[str]:
+    """Language name for a filename, or None if unknown or only decidable by shebang."""
+    idx = classify_filename(filename)
+    return _LANGUAGE_NAMES[idx] if idx >= 0 else None
+
+
+def classify_shebang(head: bytes) -> int:
+    """Language index from a `#!` line such as `#!/usr/bin/env python3`, or -1."""
+    match = _SHEBANG_RE.match(head)
+    if not match:
+        return -1
+    program = match.group(1).rsplit(b"/", 1)[-1]
+    if program == b"env" and match.group(2):
+        program = match.group(2)
+    # python3.11 -> python
+    program = program.rstrip(b"0123456789.").decode("ascii", "ignore")
+    return _SHEBANG_TABLE.get(program, -1)
+
+
+def scan_file(filepath: str, sniff: bool = False) -> Tuple[int, int, int]:
+    """
+    Read a file once in binary chunks.
+    Returns: (shebang_language_index or -1, line_count, byte_count)
+    With sniff=True (language decided by the shebang alone), a file without a
+    known shebang is not read past the first chunk and its line count is -1.
+    """
+    try:
+        with open(filepath, "rb") as f:
+            chunk = f.read(_READ_CHUNK)
+            shebang = classify_shebang(chunk[:_SHEBANG_MAX]) if chunk[:2] == b"#!" else -1
+            if sniff and shebang < 0:
+                # LICENSE, AUTHORS, binaries...: not code, so don't count them
+                return -1, -1, len(chunk)
+            lines = chunk.count(b"\n")
+            size = len(chunk)
+            while len(chunk) == _READ_CHUNK:
+                chunk = f.read(_READ_CHUNK)
+                lines += chunk.count(b"\n")
+                size += len(chunk)
+    except OSError:
+        return -1, 0, 0
+    return shebang, lines, size
+
+
+class LanguageTotals:
+    """Per-language file/line/byte counters in flat arrays indexed by language index."""
+
+    __slots__ = ("files", "lines", "bytes")
+
+    def __init__(self):
+        self.files = array("q", bytes(8 * len(_LANGUAGE_NAMES)))
+        self.lines = array("q", bytes(8 * len(_LANGUAGE_NAMES)))
+        self.bytes = array("q", bytes(8 * len(_LANGUAGE_NAMES)))
+
+    def add(self, idx: int, lines: int, size: int) -> None:
+        self.files[idx] += 1
+        self.lines[idx] += lines
+        self.bytes[idx] += size
+
+    def summarize(self) -> Tuple[List[str], str, int, int, List[dict]]:
+        """Rank languages by bytes and compute each one's share."""
+        present = [i for i in range(len(_LANGUAGE_NAMES)) if self.files[i]]
+        file_count = sum(self.files)
+        total_lines = sum(self.lines)
+        if not present:
+            return ["Unknown"], "Unknown", file_count, total_lines, []
+
+        present.sort(key=lambda i: (self.bytes[i], self.files[i]), reverse=True)
+        total_bytes = sum(self.bytes) or 1
+        stats = [
+            {
+                "language": _LANGUAGE_NAMES[i],
+                "files": self.files[i],
+                "lines": self.lines[i],
+                "bytes": self.bytes[i],
+                "percentage": round(100.0 * self.bytes[i] / total_bytes, 1),
+            }
+            for i in present
+        ]
+        languages = [_LANGUAGE_NAMES[i] for i in present]
+        return languages, languages[0], file_count, total_lines, stats
+
+
+def detect_languages(repo_path: str) -> Tuple[List[str], str, int, int, List[dict]]:
+    """
+    Detect programming languages used in the repo, weighted by bytes.
+    Returns: (languages_list, primary_language, file_count, total_lines, language_stats)
+    """
+    totals = LanguageTotals()
 
     for root, dirs, files in os.walk(repo_path):
         # Skip unwanted directories
@@ -82,29 +247,64 @@ def detect_languages(repo_path: str) -> Tuple[List[str], str, int, int]:
             if filename in SKIP_FILES:
                 continue
 
-            ext = Path(filename).suffix.lower()
-            lang = EXTENSION_MAP.get(ext)
+            idx = classify_filename(filename)
+            if idx == -1:
+                continue
+
+            shebang, lines, size = scan_file(os.path.join(root, filename), sniff=idx == _SNIFF)
+            if idx == _SNIFF:
+                idx = shebang
+                if idx < 0:
+                    continue
+            totals.add(idx, lines, size)
 
-            if lang and lang not in ("JSON", "YAML", "TOML", "XML", "Markdown"):
-                lang_counts[lang] = lang_counts.get(lang, 0) + 1
-                file_count += 1
+    return totals.summarize()
 
-                # Count lines
-                filepath = os.path.join(root, filename)
-                try:
-                    content = read_file_safe(filepath, max_chars=100000)
-                    total_lines += content.count("\n")
-                except Exception:
-                    pass
 
-    if not lang_counts:
-        return ["Unknown"], "Unknown", file_count, total_lines
+def detect_languages_from_blobs(
+    repo_path: str,
+    blobs: List[Tuple[str, str, int]],
+    blob_cache,
+) -> Tuple[List[str], str, int, int, List[dict]]:
+    """
+    Same as detect_languages, but driven by a (path, blob_id, size) tree listing.
+    Sizes come from the listing and line counts/shebangs from the blob cache;
+    only blobs never seen before are read.
+    """
+    totals = LanguageTotals()
+
+    candidates = []
+    for rel_path, oid, size in blobs:
+        parts = rel_path.split("/")
+        filename = parts[-1]
+        if filename in SKIP_FILES:
+            continue
+        if any(d in SKIP_DIRS or d.startswith(".") for d in parts[:-1]):
+            continue
+
+        idx = classify_filename(filename)
+        if idx != -1:
+            candidates.append((rel_path, oid, size, idx))
+
+    cached = blob_cache.get_many(oid for _, oid, _, _ in candidates)
+    new_entries = {}
+    for rel_path, oid, size, idx in candidates:
+        entry = new_entries.get(oid) or cached.get(oid)
+        # lines is -1 if an earlier sniff stopped early; a code file with the same content needs a full scan
+        if entry is None or "shebang" not in entry or (idx != _SNIFF and entry["lines"] < 0):
+            shebang, lines, _ = scan_file(os.path.join(repo_path, rel_path), sniff=idx == _SNIFF)
+            entry = {"lines": lines, "shebang": _LANGUAGE_NAMES[shebang] if shebang >= 0 else None}
+            new_entries[oid] = entry
+
+        if idx == _SNIFF:
+            idx = _LANGUAGE_INDEX.get(entry["shebang"], -1)
+            if idx < 0:
+                continue
+        totals.add(idx, entry["lines"], size)
 
-    sorted_langs = sorted(lang_counts.items(), key=lambda x: x[1], reverse=True)
-    languages = [lang for lang, _ in sorted_langs]
-    primary_language = languages[0] if languages else "Unknown"
+    blob_cache.put_many(new_entries.items())
 
-    return languages, primary_language, file_count, total_lines
+    return totals.summarize()
 
 
 def detect_frameworks(repo_path: str, languages: List[str]) -> Tuple[List[str], List[str], Dict[str, List[str]]]: